@@ -0,0 +1,5 @@
+import os
+
+# Importing the judge models builds API clients, which need a key even if no request is sent
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("SAMBANOVA_API_KEY", "test")
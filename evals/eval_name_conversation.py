@@ -3,7 +3,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.config import config
-from src.metrics.comparison_g_eval.comparison_g_eval_metric import ComparisonGEval
+from src.metrics.comparison_g_eval.multi_criteria_metric import MultiCriteriaComparisonGEval
 from src.prompts.name_conversation import run_prompt
 import weave
 from weave import Evaluation
@@ -12,21 +12,29 @@ from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 
 
 
-is_valid_conversation_name_metric = ComparisonGEval(
+# The steps are separate checks, so they're judged as criteria in a single call
+is_valid_conversation_name_metric = MultiCriteriaComparisonGEval(
     verbose_mode=True,
     name="Is Valid Conversation Name",
-    evaluation_steps=[
-        "The output should be a short name for the conversation",
-        "The short should describe at least one main theme of the conversation specifically",
-        "The name should not mention the user or use the word 'conversation'",
-        "The name should be professional and less than 4 words",
-        "If the name is not clear, it should be 'Untitled'",
-        "The output should not include punctuation or special formatting"
-    ],
+    criteria={
+        "Describes the conversation": [
+            "The output should be a short name for the conversation",
+            "The short should describe at least one main theme of the conversation specifically",
+            "If the name is not clear, it should be 'Untitled'",
+        ],
+        "Impersonal": [
+            "The name should not mention the user or use the word 'conversation'",
+        ],
+        "Professional and plain": [
+            "The name should be professional and less than 4 words",
+            "The output should not include punctuation or special formatting",
+        ],
+    },
     evaluation_params=[LLMTestCaseParams.INPUT,
                        LLMTestCaseParams.ACTUAL_OUTPUT],
     **config.get_model_param(),
-    **config.get_async_param()
+    **config.get_async_param(),
+    **config.get_cache_param()
 )
 
 weave.init(config.WEAVE_PROJECT)
@@ -46,12 +54,17 @@ def match_score(expected_output: str, model_output: dict) -> dict:
         actual_output=model_output['generated_name']
     )
     metric = is_valid_conversation_name_metric
-    metric.measure(test_case)
+    result = metric.measure_result(test_case)
 
-    score = metric.score
-    reason = metric.reason if score < 1.0 else ""
+    score = result.score
+    reason = "\n".join(
+        f"{criterion}: {criterion_result.reason}"
+        for criterion, criterion_result in result.criteria.items()
+        if criterion_result.score < 1.0
+    )
+    criteria_scores = {criterion: criterion_result.score for criterion, criterion_result in result.criteria.items()}
 
-    return {'score': score, 'reason': reason, 'passed': score > 0.5}
+    return {'score': score, 'reason': reason, 'passed': score > 0.5, 'criteria': criteria_scores}
 
 
 def create_examples(dataset):
@@ -29,7 +29,8 @@ is_blockbuster_material_metric = ComparisonGEval(
     evaluation_params=[LLMTestCaseParams.INPUT,
                        LLMTestCaseParams.ACTUAL_OUTPUT],
     **config.get_model_param(),
-    **config.get_async_param()
+    **config.get_async_param(),
+    **config.get_cache_param()
 )
 
 weave.init(config.WEAVE_PROJECT)
@@ -49,10 +50,10 @@ def match_score(expected_output: str, model_output: dict) -> dict:
         actual_output=model_output['output']
     )
     metric = is_blockbuster_material_metric
-    metric.measure(test_case)
+    result = metric.measure_result(test_case)
 
-    score = metric.score
-    reason = metric.reason if score < 1.0 else ""
+    score = result.score
+    reason = result.reason if score < 1.0 else ""
 
     return {'score': score, 'reason': reason, 'passed': score > 0.5}
 
@@ -1,10 +1,14 @@
+import asyncio
 import json
 from datetime import datetime
 from pathlib import Path
 import plotly.graph_objects as go
 from jinja2 import Template
-from src.utils.run_essay_eval import run_essay_eval, EssayEvalConfig
-from src.prompts.improve_essay_rubric import improve_essay_rubric
+from src.utils.essay_selection import EssaySelector
+from src.utils.racing import a_race_rubrics, stratified_order
+from src.utils.run_essay_eval import a_run_essay_eval, build_controller, load_dataset, run_essay_eval, EssayEvalConfig
+from src.utils.score_store import ScoreStore
+from src.prompts.improve_essay_rubric import a_improve_essay_rubric, improve_essay_rubric
 
 
 def save_to_json(data, filename):
@@ -23,7 +27,8 @@ def save_to_json(data, filename):
 def create_html_report(backup_data):
     # Create kappa history graph
     kappa_history = [item['kappa'] for item in backup_data['rubric_history']]
-    iterations = list(range(len(kappa_history)))
+    # Beam mode evaluates several rubrics per iteration
+    iterations = [item['iteration'] for item in backup_data['rubric_history']]
 
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=iterations, y=kappa_history,
@@ -83,7 +88,17 @@ def create_html_report(backup_data):
     print(f"HTML report saved to {report_path}")
 
 
-def optimize_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10):
+def search_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10, include_reason=False,
+                  active_selection=False):
+    """One rubric at a time: evaluate it, ask for one improvement, repeat.
+
+    With ``active_selection`` every iteration after the first judges only the
+    essays an ``EssaySelector`` picks, and its kappa is the selector's
+    reweighted estimate of the kappa over all representative essays.
+    """
+    selector = None
+    if active_selection:
+        selector = EssaySelector([item['essay_id'] for item in load_dataset("representative", rater_id)])
     rubric_history = []
     iteration = 0
     current_rubric = initial_rubric
@@ -91,25 +106,26 @@ def optimize_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10):
     best_kappa = 0
 
     while iteration < max_iterations:
+        weights = selector.select() if selector is not None and rubric_history else None
         config = EssayEvalConfig(
             rubric=current_rubric,
             rater_id=rater_id,
-            dataset="representative"
+            dataset="representative",
+            essay_ids=None if weights is None else list(weights),
+            # Iterations mostly need kappa; reasons are still fetched for the misses
+            include_reason=include_reason,
+            # A rubric seen before (this run or an earlier one) reuses its stored scores
+            score_store=True
         )
         results, current_kappa = run_essay_eval(config)
-
-        stripped_results = [
-            {k: v for k, v in result.items() if k != 'essay_text'} for result in results]
-
-        rubric_history.append({
-            "iteration": iteration,
-            "rubric": current_rubric,
-            "kappa": current_kappa,
-            "kappa_delta": target_kappa - current_kappa,
-            "results": stripped_results
-        })
-
-        print(f"Iteration {iteration}: Kappa = {current_kappa}")
+        if weights is not None:
+            current_kappa = EssaySelector.estimate_kappa(results, weights)
+        if selector is not None:
+            selector.update(results)
+        entry = history_entry(iteration, current_rubric, results, current_kappa, target_kappa)
+        if weights is not None:
+            entry["essays_judged"] = len(results)
+        rubric_history.append(entry)
 
         # Update best_rubric if current_kappa is better
         if current_kappa > best_kappa:
@@ -123,15 +139,129 @@ def optimize_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10):
             rubric_history, rater_id, max_iterations, target_kappa)
         iteration += 1
 
+    return best_rubric, best_kappa, rubric_history
+
+
+async def a_beam_search_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10, include_reason=False,
+                               beam_width=3, num_candidates=2, racing=False, min_essays=12):
+    """Keep the ``beam_width`` best rubrics, asking for ``num_candidates`` improvements of each per iteration.
+
+    Improver calls stream on the same event loop as the judge calls, and
+    every candidate is evaluated as soon as its rubric arrives, so improver
+    and judge calls overlap, and all evaluations share the
+    representative essay set and one judge concurrency limit. With
+    ``racing`` an iteration's candidates are instead raced by successive
+    halving from ``min_essays`` essays up (see ``a_race_rubrics``), and only
+    those that make it to the full set can enter the beam.
+    """
+    controller = build_controller(EssayEvalConfig(rubric=initial_rubric, rater_id=rater_id, dataset="representative"))
+    essay_ids = stratified_order(load_dataset("representative", rater_id))
+    rubric_history = []
+    seen = {ScoreStore.rubric_hash(initial_rubric)}
+
+    async def run(rubric, subset=None):
+        config = EssayEvalConfig(
+            rubric=rubric,
+            rater_id=rater_id,
+            dataset="representative",
+            essay_ids=subset,
+            include_reason=include_reason,
+            score_store=True
+        )
+        return await a_run_essay_eval(config, controller=controller)
+
+    async def evaluate(iteration, rubric):
+        results, kappa = await run(rubric)
+        entry = history_entry(iteration, rubric, results, kappa, target_kappa)
+        rubric_history.append(entry)
+        return entry
+
+    async def improve(parent):
+        # The improver works from the last history entry, so the parent goes last
+        history = [entry for entry in rubric_history if entry is not parent] + [parent]
+        rubric = await a_improve_essay_rubric(history, rater_id, max_iterations, target_kappa)
+        if ScoreStore.rubric_hash(rubric) in seen:
+            return None
+        seen.add(ScoreStore.rubric_hash(rubric))
+        return rubric
+
+    async def propose(iteration, parent):
+        rubric = await improve(parent)
+        return None if rubric is None else await evaluate(iteration, rubric)
+
+    async def race(iteration, parents):
+        rubrics = await asyncio.gather(*(improve(parent) for parent in parents for _ in range(num_candidates)))
+        outcomes = await a_race_rubrics(
+            [rubric for rubric in rubrics if rubric is not None], run, essay_ids, min_essays=min_essays,
+            bar=beam[-1]["kappa"] if len(beam) >= beam_width else None)
+        candidates = []
+        for outcome in outcomes:
+            if not outcome["complete"]:
+                # A kappa over a few essays isn't comparable to the rest, so it stays out of the
+                # history the improver, the report and rescoring work from
+                print(f"Iteration {iteration}: raced out after {outcome['essays']} essays (kappa {outcome['kappa']})")
+                continue
+            entry = history_entry(iteration, outcome["rubric"], outcome["results"], outcome["kappa"], target_kappa)
+            rubric_history.append(entry)
+            candidates.append(entry)
+        return candidates
+
+    beam = [await evaluate(0, initial_rubric)]
+    for iteration in range(1, max_iterations):
+        if beam[0]["kappa"] >= target_kappa:
+            break
+        if racing:
+            candidates = await race(iteration, beam)
+        else:
+            candidates = await asyncio.gather(*(
+                propose(iteration, parent) for parent in beam for _ in range(num_candidates)))
+        beam = sorted(beam + [entry for entry in candidates if entry is not None],
+                      key=lambda entry: entry["kappa"], reverse=True)[:beam_width]
+        print(f"Iteration {iteration}: beam kappas = {[entry['kappa'] for entry in beam]}")
+
+    return beam[0]["rubric"], beam[0]["kappa"], rubric_history
+
+
+def history_entry(iteration, rubric, results, kappa, target_kappa):
+    judge_calls_saved = sum(result['ai_source'] == 'store' for result in results)
+    print(f"Iteration {iteration}: Kappa = {kappa} ({judge_calls_saved}/{len(results)} essays reused from the score store)")
+    return {
+        "iteration": iteration,
+        "rubric": rubric,
+        "kappa": kappa,
+        "kappa_delta": target_kappa - kappa,
+        "judge_calls_saved": judge_calls_saved,
+        "results": [{k: v for k, v in result.items() if k != 'essay_text'} for result in results]
+    }
+
+
+def optimize_rubric(initial_rubric, rater_id, target_kappa, max_iterations=10, include_reason=False,
+                    beam_width=1, num_candidates=1, racing=False, active_selection=False):
+    """Search for a rubric that reaches ``target_kappa``; ``beam_width`` or ``num_candidates`` > 1 turns on beam mode."""
+    beam = beam_width > 1 or num_candidates > 1
+    if active_selection and beam:
+        # Beam candidates are compared on the full set; sampled kappas would rank them on noise
+        raise ValueError("active_selection only applies to the sequential search (beam_width=1, num_candidates=1)")
+    if beam:
+        best_rubric, best_kappa, rubric_history = asyncio.run(a_beam_search_rubric(
+            initial_rubric, rater_id, target_kappa, max_iterations, include_reason, beam_width, num_candidates,
+            racing))
+    else:
+        best_rubric, best_kappa, rubric_history = search_rubric(
+            initial_rubric, rater_id, target_kappa, max_iterations, include_reason, active_selection)
+
     print(f"Best kappa achieved: {best_kappa}")
     print(f"Running final evaluation with best rubric... {best_rubric}")
     final_config = EssayEvalConfig(
         rubric=best_rubric,
         rater_id=rater_id,
         dataset="evaluation",
-        num_examples=10
+        # Judge random essays until the kappa is known to within +/-0.1, rather than a fixed 10
+        kappa_ci_width=0.2,
+        score_store=True
     )
     final_results, final_kappa = run_essay_eval(final_config)
+    print(f"Final evaluation: {sum(result['ai_source'] == 'store' for result in final_results)}/{len(final_results)} essays reused from the score store")
 
     # Prepare data for JSON backup
     backup_data = {
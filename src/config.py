@@ -1,3 +1,4 @@
+import json
 import os
 
 
@@ -5,17 +6,55 @@ class Config:
     USE_SAMBANOVA = os.environ.get('USE_SAMBANOVA', '0') == '1'
     NO_ASYNC_MODE = os.environ.get('NO_ASYNC_MODE', '0') == '1'
     ASYNC_MODE = not NO_ASYNC_MODE
+    SAMBANOVA_MAX_CONNECTIONS = int(os.environ.get('SAMBANOVA_MAX_CONNECTIONS', '32'))
+    # e.g. {"sambanova/Meta-Llama-3.1-405B-Instruct": {"rpm": 10, "tpm": 100000}}
+    RATE_LIMITS = json.loads(os.environ.get('RATE_LIMITS', '{}'))
+    RATE_LIMIT_STATE_DIR = os.environ.get('RATE_LIMIT_STATE_DIR')
+    CONCURRENCY = int(os.environ.get('CONCURRENCY', '1' if NO_ASYNC_MODE else '8'))
+    MAX_CONCURRENCY = int(os.environ.get('MAX_CONCURRENCY', str(CONCURRENCY if NO_ASYNC_MODE else CONCURRENCY * 4)))
     NUM_EXAMPLES = int(os.environ.get('NUM_EXAMPLES', '-1'))
     WEAVE_PROJECT = os.environ.get('WEAVE_PROJECT', 'pro-bias')
+    # Off by default: judges sample at temperature 0.7, and a cache freezes one sample per prompt
+    JUDGE_CACHE_MODE = os.environ.get('JUDGE_CACHE_MODE', 'off')
+    JUDGE_CACHE_PATH = os.environ.get('JUDGE_CACHE_PATH', '.cache/judge_cache.sqlite')
+    JUDGE_CACHE_MAX_ENTRIES = int(os.environ.get('JUDGE_CACHE_MAX_ENTRIES', '100000'))
+    # e.g. [{"name": "sn-a", "base_url": "https://api.sambanova.ai/v1", "api_key_env": "SAMBANOVA_API_KEY_A",
+    #        "model": "Meta-Llama-3.1-405B-Instruct", "weight": 2}, ...]
+    JUDGE_ENDPOINTS = json.loads(os.environ.get('JUDGE_ENDPOINTS', '[]'))
+    JUDGE_MODEL_NAME = os.environ.get('JUDGE_MODEL_NAME')
+    # A cheaper judge that scores first, e.g. gpt-4o-mini or Meta-Llama-3.1-8B-Instruct with USE_SAMBANOVA
+    JUDGE_CASCADE_MODEL = os.environ.get('JUDGE_CASCADE_MODEL')
+    PRE_SCORER_PATH = os.environ.get('PRE_SCORER_PATH', '.cache/pre_scorer.sqlite')
+    SCORE_STORE_PATH = os.environ.get('SCORE_STORE_PATH', '.cache/score_store.sqlite')
+    IMPROVER_TOKEN_BUDGET = int(os.environ.get('IMPROVER_TOKEN_BUDGET', '20000'))
 
     @classmethod
     def get_model_param(cls):
+        if cls.JUDGE_ENDPOINTS:
+            from src.deepeval.router_llm import get_router_llm
+            return {'model': get_router_llm()}
         from src.deepeval.sambanova_llm import sambanova_openai
         return {'model': sambanova_openai} if cls.USE_SAMBANOVA else {}
 
+    @classmethod
+    def get_cascade_param(cls, model_name=None):
+        model_name = model_name or cls.JUDGE_CASCADE_MODEL
+        if not model_name:
+            return {}
+        if cls.USE_SAMBANOVA:
+            from src.deepeval.sambanova_llm import SambanovaOpenAI
+            from src.utils.judge_cache import get_judge_cache
+            return {'cascade_model': SambanovaOpenAI(model_name=model_name, cache=get_judge_cache())}
+        return {'cascade_model': model_name}
+
     @classmethod
     def get_async_param(cls):
         return {'async_mode': cls.ASYNC_MODE}
 
+    @classmethod
+    def get_cache_param(cls):
+        from src.utils.judge_cache import get_judge_cache
+        return {'cache': get_judge_cache()}
+
 
 config = Config()
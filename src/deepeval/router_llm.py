@@ -0,0 +1,213 @@
+import logging
+import os
+import random
+import threading
+import time
+
+import openai
+from deepeval.models.base_model import DeepEvalBaseLLM
+from openai.types.chat import ChatCompletion
+
+from src.config import config
+from src.deepeval.sambanova_llm import SambanovaOpenAI
+from src.utils.adaptive_concurrency import retry_after
+from src.utils.judge_cache import JudgeCache, get_judge_cache
+from src.utils.rate_limiter import estimate_tokens, get_rate_limiter
+
+log = logging.getLogger(__name__)
+
+# Errors that say "this endpoint, right now" rather than "this request"
+FAILOVER_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+MAX_COOLDOWN = 60.0
+
+
+class Endpoint:
+    """One OpenAI-compatible backend plus the health the router tracks for it."""
+
+    def __init__(self, name: str, llm: SambanovaOpenAI, weight: float = 1.0):
+        self.name = name
+        self.llm = llm
+        self.weight = weight
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.down_until = 0.0
+
+    def healthy(self, now: float) -> bool:
+        return self.down_until <= now
+
+
+class RouterLLM(DeepEvalBaseLLM):
+    """Spreads judge calls over several OpenAI-compatible endpoints serving the same model.
+
+    Each call goes to a healthy endpoint picked by weight, discounted by the
+    calls it already has in flight. 429s, connection errors and 5xx responses
+    take an endpoint out of rotation for a while (its Retry-After, or an
+    exponential cooldown) and the call fails over to the next one. Responses
+    are cached under the router's ``model_name``, so a cached verdict doesn't
+    depend on which endpoint produced it.
+    """
+
+    def __init__(self, endpoints: list[dict], model_name: str | None = None, cache: JudgeCache | None = None):
+        if not endpoints:
+            raise ValueError("RouterLLM needs at least one endpoint")
+        self.endpoint_specs = endpoints
+        super().__init__(model_name or endpoints[0]["model"])
+        self.endpoints: list[Endpoint] = self.model
+        self.cache = cache
+        # Overall budget for the model, taken once per call however many endpoints it
+        # fails over to; each endpoint also paces itself under its own name
+        self.rate_limiter = get_rate_limiter("router", self.model_name)
+        self.temperature = 0.7
+        for endpoint in self.endpoints:
+            endpoint.llm.temperature = self.temperature
+        self._lock = threading.Lock()
+
+    def load_model(self):
+        endpoints = []
+        for i, spec in enumerate(self.endpoint_specs):
+            name = spec.get("name", f"endpoint-{i}")
+            llm = SambanovaOpenAI(
+                model_name=spec["model"],
+                base_url=spec["base_url"],
+                api_key=os.environ.get(spec.get("api_key_env", "SAMBANOVA_API_KEY")),
+                provider=name,
+                # Failing over is the router's retry; the client retrying a struggling endpoint only delays it
+                max_retries=0,
+            )
+            endpoints.append(Endpoint(name, llm, spec.get("weight", 1.0)))
+        return endpoints
+
+    def _pick(self, tried: set[str]) -> Endpoint | None:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.name not in tried]
+            if not candidates:
+                return None
+            healthy = [e for e in candidates if e.healthy(now)]
+            if healthy:
+                weights = [e.weight / (1 + e.in_flight) for e in healthy]
+                endpoint = random.choices(healthy, weights)[0]
+            else:
+                # Everything is cooling down: try whichever recovers first rather than failing outright
+                endpoint = min(candidates, key=lambda e: e.down_until)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def _release(self, endpoint: Endpoint, error: Exception | None = None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.consecutive_errors = 0
+                return
+            endpoint.errors += 1
+            endpoint.consecutive_errors += 1
+            cooldown = retry_after(error)
+            if cooldown is None:
+                cooldown = min(MAX_COOLDOWN, 2 ** (endpoint.consecutive_errors - 1))
+            endpoint.down_until = time.monotonic() + cooldown
+        log.info(f"Endpoint {endpoint.name} failed ({type(error).__name__}), out of rotation for {cooldown:.1f}s")
+
+    def _cache_key(self, prompt: str, params: dict) -> str | None:
+        if self.cache is None:
+            return None
+        return JudgeCache.make_key(self.model_name, prompt, {"temperature": self.temperature, **params})
+
+    def generate_raw_response(self, prompt: str, **kwargs) -> tuple[ChatCompletion, None]:
+        key = self._cache_key(prompt, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached), None
+
+        self.rate_limiter.acquire(estimate_tokens(prompt, kwargs.get("max_tokens"), kwargs.get("n") or 1))
+        tried = set()
+        error = None
+        while (endpoint := self._pick(tried)) is not None:
+            tried.add(endpoint.name)
+            try:
+                response, _ = endpoint.llm.generate_raw_response(prompt, **kwargs)
+            except FAILOVER_ERRORS as e:
+                self._release(endpoint, e)
+                error = e
+                continue
+            except BaseException:
+                self._release(endpoint)
+                raise
+            self._release(endpoint)
+            if key is not None:
+                self.cache.set(key, response.model_dump())
+            return response, None
+        # Surface the last provider error so callers' 429/timeout handling still applies
+        raise error
+
+    async def a_generate_raw_response(self, prompt: str, **kwargs) -> tuple[ChatCompletion, None]:
+        key = self._cache_key(prompt, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached), None
+
+        await self.rate_limiter.a_acquire(estimate_tokens(prompt, kwargs.get("max_tokens"), kwargs.get("n") or 1))
+        tried = set()
+        error = None
+        while (endpoint := self._pick(tried)) is not None:
+            tried.add(endpoint.name)
+            try:
+                response, _ = await endpoint.llm.a_generate_raw_response(prompt, **kwargs)
+            except FAILOVER_ERRORS as e:
+                self._release(endpoint, e)
+                error = e
+                continue
+            except BaseException:
+                # Includes cancellation by a hedged duplicate winning
+                self._release(endpoint)
+                raise
+            self._release(endpoint)
+            if key is not None:
+                self.cache.set(key, response.model_dump())
+            return response, None
+        raise error
+
+    def generate(self, prompt: str) -> str:
+        response, _ = self.generate_raw_response(prompt)
+        return response.choices[0].message.content
+
+    async def a_generate(self, prompt: str) -> str:
+        response, _ = await self.a_generate_raw_response(prompt)
+        return response.choices[0].message.content
+
+    def get_model_name(self) -> str:
+        return self.model_name
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                e.name: {
+                    "requests": e.requests,
+                    "errors": e.errors,
+                    "in_flight": e.in_flight,
+                    "healthy": e.healthy(now),
+                }
+                for e in self.endpoints
+            }
+
+
+_router_llm: RouterLLM | None = None
+_router_llm_lock = threading.Lock()
+
+
+def get_router_llm() -> RouterLLM:
+    """Process-wide router over the JUDGE_ENDPOINTS endpoints."""
+    global _router_llm
+    with _router_llm_lock:
+        if _router_llm is None:
+            _router_llm = RouterLLM(
+                config.JUDGE_ENDPOINTS,
+                model_name=config.JUDGE_MODEL_NAME,
+                cache=get_judge_cache(),
+            )
+        return _router_llm
@@ -4,56 +4,196 @@
 
 
 from deepeval.models.base_model import DeepEvalBaseLLM
+from openai.types.chat import ChatCompletion
+import asyncio
+import httpx
 import openai
 import os
 import logging
+import weakref
+from src.config import config
+from src.utils.judge_cache import JudgeCache, get_judge_cache
+from src.utils.rate_limiter import estimate_tokens, get_rate_limiter
 
 log = logging.getLogger(__name__)
 # logging.basicConfig(level=logging.INFO)
 
+
+class NoRateLimitRetryAsyncOpenAI(openai.AsyncOpenAI):
+    """Retries 5xx responses and dropped connections as usual, but hands 429s straight back.
+
+    Async callers retry through AdaptiveConcurrency, which needs to see the
+    429s to back off; the SDK retrying them would hide the throttling.
+    """
+
+    def _should_retry(self, response: httpx.Response) -> bool:
+        return response.status_code != 429 and super()._should_retry(response)
+
+
 class SambanovaOpenAI(DeepEvalBaseLLM):
-    def __init__(self, model_name: str = 'Meta-Llama-3.1-405B-Instruct'):
+    def __init__(
+        self,
+        model_name: str = 'Meta-Llama-3.1-405B-Instruct',
+        cache: JudgeCache | None = None,
+        base_url: str = "https://api.sambanova.ai/v1",
+        api_key: str | None = None,
+        provider: str = "sambanova",
+        max_retries: int = openai.DEFAULT_MAX_RETRIES,
+    ):
+        # Any OpenAI-compatible endpoint works; SambaNova is just the default
+        self.base_url = base_url
+        self.api_key = api_key or os.environ.get("SAMBANOVA_API_KEY")
+        self.max_retries = max_retries
         super().__init__(model_name)
         self.client = self.load_model()
+        # httpx pools are bound to the event loop that opened them, so each loop gets its own client
+        self._async_clients = weakref.WeakKeyDictionary()
+        self.cache = cache
+        self.rate_limiter = get_rate_limiter(provider, model_name)
+        self.temperature = 0.7
 
-    def load_model(self):
+    def load_model(self, async_mode: bool = False):
+        # Keep-alive connections let concurrent judge calls skip the TLS handshake
+        limits = httpx.Limits(
+            max_connections=config.SAMBANOVA_MAX_CONNECTIONS,
+            max_keepalive_connections=config.SAMBANOVA_MAX_CONNECTIONS,
+            keepalive_expiry=60,
+        )
+        if async_mode:
+            return NoRateLimitRetryAsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                http_client=openai.DefaultAsyncHttpxClient(limits=limits),
+                max_retries=self.max_retries,
+            )
         return openai.OpenAI(
-            api_key=os.environ.get("SAMBANOVA_API_KEY"),
-            base_url="https://api.sambanova.ai/v1",
+            api_key=self.api_key,
+            base_url=self.base_url,
+            http_client=openai.DefaultHttpxClient(limits=limits),
+            max_retries=self.max_retries,
         )
 
-    def generate(self, prompt: str) -> str:
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = self.load_model(
+                async_mode=True)
+        return client
+
+    def _messages(self, prompt: str):
+        return [
+            # {"role": "system", "content": "You are a helpful evaluator. Your job is to judge output and evaluate whether or not it meets a given criteria. Choose carefully from options A - G. Pick the answer that best represents the output."},
+            {"role": "user", "content": prompt}]
+
+    def _cache_key(self, prompt: str, params: dict) -> str | None:
+        if self.cache is None:
+            return None
+        return JudgeCache.make_key(self.model_name, prompt, {"temperature": self.temperature, **params})
+
+    def generate_raw_response(self, prompt: str, **kwargs) -> tuple[ChatCompletion, None]:
+        key = self._cache_key(prompt, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached), None
+
+        self.rate_limiter.acquire(estimate_tokens(prompt, kwargs.get("max_tokens"), kwargs.get("n") or 1))
         response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=[
-                # {"role": "system", "content": "You are a helpful evaluator. Your job is to judge output and evaluate whether or not it meets a given criteria. Choose carefully from options A - G. Pick the answer that best represents the output."},
-                {"role": "user", "content": prompt}],
-            temperature=0.7,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            **kwargs,
         )
-        # log.info(f"Prompt: {prompt}")
-        response_text = response.choices[0].message.content
-        # log.info(f"Response text: {response_text}")
-        return response_text
+        if key is not None:
+            self.cache.set(key, response.model_dump())
+        # SambaNova doesn't report a price, so there is no cost to return
+        return response, None
 
-    async def a_generate(self, prompt: str) -> str:
-        response = self.client.chat.completions.create(
+    async def a_generate_raw_response(self, prompt: str, **kwargs) -> tuple[ChatCompletion, None]:
+        key = self._cache_key(prompt, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ChatCompletion.model_validate(cached), None
+
+        await self.rate_limiter.a_acquire(estimate_tokens(prompt, kwargs.get("max_tokens"), kwargs.get("n") or 1))
+        response = await self.async_client.chat.completions.create(
+            model=self.model_name,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            **kwargs,
+        )
+        if key is not None:
+            self.cache.set(key, response.model_dump())
+        return response, None
+
+    async def a_stream(self, prompt: str, **kwargs):
+        """Yield the completion text in pieces as it streams in.
+
+        A stream read to the end is cached like ``a_generate_raw_response``;
+        one the caller closes early is not.
+        """
+        key = self._cache_key(prompt, kwargs)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                yield ChatCompletion.model_validate(cached).choices[0].message.content
+                return
+
+        await self.rate_limiter.a_acquire(estimate_tokens(prompt, kwargs.get("max_tokens"), kwargs.get("n") or 1))
+        stream = await self.async_client.chat.completions.create(
             model=self.model_name,
-            messages=[
-                # {"role": "system", "content": "You are a helpful evaluator. Your job is to judge output and evaluate whether or not it meets a given criteria. Choose carefully from options A - G. Pick the answer that best represents the output."},
-                {"role": "user", "content": prompt}],
-            temperature=0.7,
+            messages=self._messages(prompt),
+            temperature=self.temperature,
+            stream=True,
+            **kwargs,
         )
+        parts = []
+        chunk = None
+        finish_reason = None
+        # Closing the generator early closes the stream, so the server stops generating
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+        if key is not None and chunk is not None:
+            self.cache.set(key, {
+                "id": chunk.id,
+                "object": "chat.completion",
+                "created": chunk.created,
+                "model": chunk.model,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": finish_reason or "stop",
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                }],
+            })
+
+    def generate(self, prompt: str) -> str:
+        response, _ = self.generate_raw_response(prompt)
         # log.info(f"Prompt: {prompt}")
         response_text = response.choices[0].message.content
         # log.info(f"Response text: {response_text}")
         return response_text
 
+    async def a_generate(self, prompt: str) -> str:
+        response, _ = await self.a_generate_raw_response(prompt)
+        return response.choices[0].message.content
+
     def get_model_name(self) -> str:
         return self.model_name
 
 
 # Usage
-sambanova_openai = SambanovaOpenAI()
+sambanova_openai = SambanovaOpenAI(cache=get_judge_cache())
 # print(sambanova_openai.generate("Write me a joke"))
 
 # # Replace these with real values
@@ -1,6 +1,14 @@
 # Inspired originally by https://github.com/confident-ai/deepeval/blob/729d505c703cee93b70bf955ac0e261acf00288a/deepeval/metrics/g_eval/g_eval.py
 """LLM evaluated metric based on the GEval framework: https://arxiv.org/pdf/2303.16634.pdf"""
 
+import asyncio
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple
+
 from deepeval.metrics import BaseMetric
 from deepeval.metrics.indicator import metric_progress_indicator
 from deepeval.metrics.utils import (
@@ -16,8 +24,12 @@ from deepeval.test_case import (
 )
 from deepeval.utils import get_or_create_event_loop, prettify_list
 
-from src.metrics.comparison_g_eval.schema import ReasonScore, Steps
+from src.metrics.comparison_g_eval.parser import ParseStats, load_json, parse_reason_score
+from src.metrics.comparison_g_eval.schema import ComparisonGEvalResult, ReasonScore, Steps
 from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
+from src.utils.hedging import LatencyTracker, hedged_call
+from src.utils.judge_cache import JudgeCache
+from src.utils.rate_limiter import DEFAULT_OUTPUT_TOKENS, estimate_tokens, get_rate_limiter, limiter_wait
 
 
 G_EVAL_PARAMS = {
@@ -29,6 +41,146 @@ G_EVAL_PARAMS = {
 }
 
 
+CHOICE_PREFIX = re.compile(r'"choice"\s*:\s*"?\s*$')
+CHOICE_LETTERS = set(ComparisonGEvalTemplate.CHOICES)
+# Room for the letter plus stray whitespace or punctuation
+CHOICE_ONLY_MAX_TOKENS = 3
+HEDGE_MIN_SAMPLES = 10
+# One-sided 95% z-score for deciding a self-consistency vote is settled
+CONSISTENCY_Z = 1.645
+
+
+class JudgeVerdict(NamedTuple):
+    choice: str
+    reason: str | None
+    choice_probs: dict[str, float] | None
+    cost: float | None
+    # Number of votes behind the verdict in self-consistency mode
+    samples: int | None = None
+    # In cascade mode, whether the verdict came from the main model rather than the cascade model
+    escalated: bool | None = None
+
+
+class CascadeStats:
+    """Escalation rate and cheap/expensive agreement of a judge cascade."""
+
+    def __init__(self):
+        self.judged = 0
+        self.escalated = 0
+        self.agreed = 0
+        self._lock = threading.Lock()
+
+    def record(self, escalated: bool, agreed: bool = False):
+        with self._lock:
+            self.judged += 1
+            if escalated:
+                self.escalated += 1
+                self.agreed += agreed
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "judged": self.judged,
+                "escalated": self.escalated,
+                "escalation_rate": self.escalated / self.judged if self.judged else None,
+                # Only escalated items were scored by both tiers
+                "tier_agreement": self.agreed / self.escalated if self.escalated else None,
+            }
+
+
+def vote_settled(score_votes: Counter, remaining: int) -> bool:
+    """Whether the leading score has won, or will almost surely win, the vote."""
+    ranked = score_votes.most_common(2)
+    leader = ranked[0][1]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0
+    if leader - runner_up > remaining:
+        return True
+    # The leader is settled once the Wilson lower bound on its share clears one half
+    n = sum(score_votes.values())
+    share = leader / n
+    z2 = CONSISTENCY_Z ** 2
+    lower = (share + z2 / (2 * n) - CONSISTENCY_Z * math.sqrt(
+        share * (1 - share) / n + z2 / (4 * n * n))) / (1 + z2 / n)
+    return lower > 0.5
+
+
+def extract_token_logprobs(res) -> list[dict] | None:
+    """Per-token logprobs of a raw judge response as plain dicts, if it has any."""
+    # deepeval's native models return a langchain AIMessage
+    metadata = getattr(res, "response_metadata", None)
+    if metadata is not None:
+        return (metadata.get("logprobs") or {}).get("content")
+    # OpenAI-compatible clients return a ChatCompletion
+    choices = getattr(res, "choices", None)
+    if choices and choices[0].logprobs is not None:
+        return [token.model_dump() for token in choices[0].logprobs.content]
+    return None
+
+
+def raw_response_content(res) -> str:
+    # OpenAI-compatible clients return a ChatCompletion, deepeval's native models an AIMessage
+    choices = getattr(res, "choices", None)
+    if choices:
+        return choices[0].message.content
+    return res.content
+
+
+def iter_choice_probs(token_logprobs: list[dict] | None, json_output: bool = True):
+    """Yield the normalized A-H distribution at every "choice" value, in response order."""
+    if not token_logprobs:
+        return
+
+    text = ""
+    for token in token_logprobs:
+        letter = token["token"].strip().strip('"').strip()
+        if letter in CHOICE_LETTERS and (not json_output or CHOICE_PREFIX.search(text)):
+            probs = {}
+            for alternative in token.get("top_logprobs") or [token]:
+                option = alternative["token"].strip().strip('"').strip()
+                if option in CHOICE_LETTERS:
+                    probs[option] = probs.get(
+                        option, 0) + math.exp(alternative["logprob"])
+            total = sum(probs.values())
+            yield {option: prob / total for option, prob in probs.items()}
+            if not json_output:
+                return
+        text += token["token"]
+
+
+def extract_choice_probs(token_logprobs: list[dict] | None, json_output: bool = True) -> dict[str, float] | None:
+    """Normalized probability of each A-H option at the position of the "choice" value.
+
+    With ``json_output=False`` the response is a bare letter, so the first
+    letter token is the choice.
+    """
+    return next(iter_choice_probs(token_logprobs, json_output), None)
+
+
+class StreamingChoiceParser:
+    """Spots the "choice" field of a streamed JSON verdict as soon as it is complete."""
+
+    CHOICE_FIELD = re.compile(r'"choice"\s*:\s*"\s*([A-H])\s*"')
+
+    def __init__(self):
+        self.text = ""
+        self.choice = None
+
+    def feed(self, delta: str) -> str | None:
+        self.text += delta
+        if self.choice is None:
+            # Only the tail can complete the field, so don't rescan the whole buffer
+            match = self.CHOICE_FIELD.search(self.text, max(0, len(self.text) - len(delta) - 32))
+            if match is not None:
+                self.choice = match.group(1)
+        return self.choice
+
+    def reason(self) -> str | None:
+        try:
+            return parse_reason_score(self.text)[1]
+        except ValueError:
+            return None
+
+
 def construct_comparison_g_eval_params_string(
     llm_test_case_params: list[LLMTestCaseParams],
 ):
@@ -57,6 +209,17 @@ class ComparisonGEval(BaseMetric):
         async_mode: bool = True,
         strict_mode: bool = False,
         verbose_mode: bool = False,
+        cache: JudgeCache | None = None,
+        score_mode: str = "choice",
+        include_reason: bool = True,
+        timeout: float | None = None,
+        hedge_quantile: float | None = None,
+        samples: int = 1,
+        samples_per_round: int = 3,
+        cascade_model: str | DeepEvalBaseLLM | None = None,
+        escalation_threshold: float = 0.8,
+        stream: bool = False,
+        stream_reasons: bool = True,
         _include_g_eval_suffix: bool = True,
     ):
         self.name = name
@@ -77,6 +240,9 @@ class ComparisonGEval(BaseMetric):
                 "'evaluation_steps' must not be an empty list. Either omit evaluation steps or include a non-empty list of steps."
             )
 
+        if score_mode not in ("choice", "logprobs"):
+            raise ValueError("'score_mode' must be either 'choice' or 'logprobs'.")
+
         self.criteria = criteria
         self.model, self.using_native_model = initialize_model(model)
         self.evaluation_model = self.model.get_model_name()
@@ -85,34 +251,70 @@ class ComparisonGEval(BaseMetric):
         self.strict_mode = strict_mode
         self.async_mode = async_mode
         self.verbose_mode = verbose_mode
+        self.score_mode = score_mode
+        self.include_reason = include_reason
+        # Async judge calls only: a deadline per call, and a duplicate request
+        # once a call outlives this quantile of recent latencies
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.latency_tracker = LatencyTracker()
+        # Self-consistency: with samples > 1 the judge is sampled in rounds of
+        # samples_per_round until the majority score is settled or samples run out
+        self.samples = samples
+        self.samples_per_round = samples_per_round
+        # Cascade: a cheaper judge scores first, and only verdicts it is less than
+        # escalation_threshold confident in (logprob or vote confidence) go to this model
+        self.cascade_metric = None
+        if cascade_model is not None:
+            self.cascade_metric = ComparisonGEval(
+                name=f"{name} (cascade)",
+                evaluation_params=evaluation_params,
+                criteria=criteria,
+                evaluation_steps=evaluation_steps,
+                model=cascade_model,
+                threshold=threshold,
+                async_mode=async_mode,
+                strict_mode=strict_mode,
+                cache=cache,
+                score_mode=score_mode,
+                include_reason=include_reason,
+                timeout=timeout,
+                hedge_quantile=hedge_quantile,
+                samples=samples,
+                samples_per_round=samples_per_round,
+            )
+        self.escalation_threshold = escalation_threshold
+        self.cascade_stats = CascadeStats()
+        # Streaming (models with a_stream, reasons on): the verdict returns as soon as
+        # the choice is parsed. The reason either keeps streaming in the background,
+        # for a_explain to pick up, or the stream is cancelled
+        self.stream = stream
+        self.stream_reasons = stream_reasons
+        self._streamed_reasons: dict[str, asyncio.Task] = {}
+        self.parse_stats = ParseStats()
+        # Models that cache their own calls (e.g. SambanovaOpenAI) don't need a second layer
+        self.cache = None if getattr(self.model, "cache", None) is not None else cache
+        # Likewise for rate limiting: only pace models that don't pace themselves
+        if getattr(self.model, "rate_limiter", None) is not None:
+            self.rate_limiter = None
+        else:
+            self.rate_limiter = get_rate_limiter("openai", self.evaluation_model)
         self._include_g_eval_suffix = _include_g_eval_suffix
+        self._evaluation_steps_lock = threading.Lock()
+        self._a_evaluation_steps_lock = asyncio.Lock()
 
     def measure(self, test_case: LLMTestCase, _show_indicator: bool = True) -> float:
         check_llm_test_case_params(test_case, self.evaluation_params, self)
 
-        self.evaluation_cost = 0 if self.using_native_model else None
         with metric_progress_indicator(self, _show_indicator=_show_indicator):
             if self.async_mode:
                 loop = get_or_create_event_loop()
-                loop.run_until_complete(self.a_measure(
-                    test_case, _show_indicator=False))
-                return self.score
-            else:  # noqa: RET505
-                self.evaluation_steps: list[str] = self._generate_evaluation_steps(
-                )
-                score, reason = self.evaluate(test_case)
-                self.reason = reason
-                self.score = 0 if self.strict_mode and score < self.threshold else score
-                self.success = self.score >= self.threshold
-                self.verbose_logs = construct_verbose_logs(
-                    self,
-                    steps=[
-                        f"Evaluation Steps:\n{prettify_list(self.evaluation_steps)}",
-                        f"Score: {self.score}\nReason: {self.reason}",
-                    ],
-                )
-
-                return self.score
+                result = loop.run_until_complete(
+                    self.a_measure_result(test_case))
+            else:
+                result = self.measure_result(test_case)
+            self._apply_result(result)
+            return self.score
 
     async def a_measure(
         self,
@@ -121,31 +323,163 @@ class ComparisonGEval(BaseMetric):
     ) -> float:
         check_llm_test_case_params(test_case, self.evaluation_params, self)
 
-        self.evaluation_cost = 0 if self.using_native_model else None
         with metric_progress_indicator(
             self,
             async_mode=True,
             _show_indicator=_show_indicator,
         ):
-            self.evaluation_steps: list[str] = await self._a_generate_evaluation_steps()
-            score, reason = await self._a_evaluate(test_case)
-            self.reason = reason
-            self.score = 0 if self.strict_mode and score < self.threshold else score
-            self.success = self.score >= self.threshold
-            self.verbose_logs = construct_verbose_logs(
-                self,
-                steps=[
-                    f"Criteria:\n{self.criteria}",
-                    f"Evaluation Steps:\n{prettify_list(self.evaluation_steps)}",
-                    f"Score: {self.score}\nReason: {self.reason}",
-                ],
-            )
-
+            result = await self.a_measure_result(test_case)
+            self._apply_result(result)
             return self.score
 
-    async def _a_generate_evaluation_steps(self) -> list[str]:
+    def measure_result(self, test_case: LLMTestCase) -> ComparisonGEvalResult:
+        """Score a test case without writing to the metric instance.
+
+        Safe to call concurrently from many threads on one shared metric.
+        """
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+        self._check_sync_deadlines()
+
+        start = time.perf_counter()
+        steps_cost = 0
+        with self._evaluation_steps_lock:
+            if self.evaluation_steps is None:
+                self.evaluation_steps, steps_cost = self._generate_evaluation_steps()
+        if self.cascade_metric is not None:
+            verdict = self._cascade(test_case)
+        else:
+            verdict = self._judge(test_case)
+        return self.build_result(
+            verdict, steps_cost, time.perf_counter() - start)
+
+    async def a_measure_result(self, test_case: LLMTestCase) -> ComparisonGEvalResult:
+        """Async counterpart of ``measure_result``, safe to run as many tasks at once."""
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        start = time.perf_counter()
+        steps_cost = 0
+        # One task generates the steps; the rest wait and judge against the same ones
+        async with self._a_evaluation_steps_lock:
+            if self.evaluation_steps is None:
+                self.evaluation_steps, steps_cost = await self._a_generate_evaluation_steps()
+        if self.cascade_metric is not None:
+            verdict = await self._a_cascade(test_case)
+        else:
+            verdict = await self._a_judge(test_case)
+        return self.build_result(
+            verdict, steps_cost, time.perf_counter() - start)
+
+    def measure_batch(self, test_cases: list[LLMTestCase]) -> list[ComparisonGEvalResult]:
+        """Score several test cases with one judge call, in the order given.
+
+        Test cases the judge's answer leaves out or garbles are re-scored with
+        single calls. Like ``measure_result``, this doesn't write to the metric.
+        """
+        for test_case in test_cases:
+            check_llm_test_case_params(test_case, self.evaluation_params, self)
+        self._check_sync_deadlines()
+
+        start = time.perf_counter()
+        steps_cost = 0
+        with self._evaluation_steps_lock:
+            if self.evaluation_steps is None:
+                self.evaluation_steps, steps_cost = self._generate_evaluation_steps()
+        verdicts = self._judge_batch(test_cases)
+        latency = time.perf_counter() - start
+
+        results = []
+        for test_case, verdict in zip(test_cases, verdicts):
+            if verdict is None:
+                results.append(self.measure_result(test_case))
+            else:
+                results.append(self.build_result(verdict, steps_cost, latency))
+            # The steps are only generated once, so only charge them once
+            steps_cost = 0
+        return results
+
+    async def a_measure_batch(self, test_cases: list[LLMTestCase], rescore_missing: bool = True) -> list[ComparisonGEvalResult | None]:
+        """Async counterpart of ``measure_batch``.
+
+        With ``rescore_missing=False`` the test cases the judge left out come
+        back as None, for callers that re-score them under their own
+        concurrency limit rather than inside the batch's slot.
+        """
+        for test_case in test_cases:
+            check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        start = time.perf_counter()
+        steps_cost = 0
+        async with self._a_evaluation_steps_lock:
+            if self.evaluation_steps is None:
+                self.evaluation_steps, steps_cost = await self._a_generate_evaluation_steps()
+        verdicts = await self._a_judge_batch(test_cases)
+        latency = time.perf_counter() - start
+
+        fallbacks = iter(await asyncio.gather(*(
+            self.a_measure_result(test_case)
+            for test_case, verdict in zip(test_cases, verdicts) if verdict is None and rescore_missing
+        )))
+        results = []
+        for verdict in verdicts:
+            if verdict is None:
+                results.append(next(fallbacks, None))
+            else:
+                results.append(self.build_result(verdict, steps_cost, latency))
+            steps_cost = 0
+        return results
+
+    def build_result(self, verdict: JudgeVerdict, steps_cost, latency) -> ComparisonGEvalResult:
+        """Score a verdict under this metric's settings, wherever it came from (judge, store, local model)."""
+        score = ComparisonGEvalTemplate.calculate_score(verdict.choice)
+        entropy = confidence = None
+        if verdict.choice_probs:
+            entropy, confidence = ComparisonGEvalTemplate.calculate_score_entropy(
+                verdict.choice_probs)
+            if verdict.samples:
+                # A vote's confidence is simply how many samples agreed with it
+                confidence = ComparisonGEvalTemplate.calculate_agreement(
+                    verdict.choice_probs)
+            if self.score_mode == "logprobs":
+                score = ComparisonGEvalTemplate.calculate_weighted_score(
+                    verdict.choice_probs)
+        score = 0 if self.strict_mode and score < self.threshold else score
+        return ComparisonGEvalResult(
+            score=score,
+            choice=verdict.choice,
+            reason=verdict.reason,
+            success=score >= self.threshold,
+            cost=self._add_costs(steps_cost, verdict.cost),
+            latency=latency,
+            choice_probs=verdict.choice_probs,
+            entropy=entropy,
+            confidence=confidence,
+            samples=verdict.samples,
+            escalated=verdict.escalated,
+        )
+
+    def _add_costs(self, *costs):
+        if not self.using_native_model:
+            return None
+        return sum(cost or 0 for cost in costs)
+
+    def _apply_result(self, result: ComparisonGEvalResult):
+        # Keep the deepeval-style attributes for callers that read them after measure()
+        self.reason = result.reason
+        self.score = result.score
+        self.success = result.success
+        self.evaluation_cost = result.cost
+        self.verbose_logs = construct_verbose_logs(
+            self,
+            steps=[
+                f"Criteria:\n{self.criteria}",
+                f"Evaluation Steps:\n{prettify_list(self.evaluation_steps)}",
+                f"Score: {self.score}\nReason: {self.reason}",
+            ],
+        )
+
+    async def _a_generate_evaluation_steps(self) -> tuple[list[str], float | None]:
         if self.evaluation_steps:
-            return self.evaluation_steps
+            return self.evaluation_steps, 0
 
         g_eval_params_str = construct_comparison_g_eval_params_string(
             self.evaluation_params)
@@ -154,21 +488,20 @@ class ComparisonGEval(BaseMetric):
         )
         if self.using_native_model:
             res, cost = await self.model.a_generate(prompt)
-            self.evaluation_cost += cost
             data = trimAndLoadJson(res, self)
-            return data["steps"]
+            return data["steps"], cost
         else:  # noqa: RET505
             try:
                 res: Steps = await self.model.a_generate(prompt, schema=Steps)
-                return res.steps
+                return res.steps, None
             except TypeError:
                 res = await self.model.a_generate(prompt)
                 data = trimAndLoadJson(res, self)
-                return data["steps"]
+                return data["steps"], None
 
-    def _generate_evaluation_steps(self) -> list[str]:
+    def _generate_evaluation_steps(self) -> tuple[list[str], float | None]:
         if self.evaluation_steps:
-            return self.evaluation_steps
+            return self.evaluation_steps, 0
 
         g_eval_params_str = construct_comparison_g_eval_params_string(
             self.evaluation_params)
@@ -177,115 +510,651 @@ class ComparisonGEval(BaseMetric):
         )
         if self.using_native_model:
             res, cost = self.model.generate(prompt)
-            self.evaluation_cost += cost
             data = trimAndLoadJson(res, self)
-            return data["steps"]
+            return data["steps"], cost
         else:  # noqa: RET505
             try:
                 res: Steps = self.model.generate(prompt, schema=Steps)
-                return res.steps
+                return res.steps, None
             except TypeError:
                 res = self.model.generate(prompt)
                 data = trimAndLoadJson(res, self)
-                return data["steps"]
+                return data["steps"], None
 
-    async def _a_evaluate(self, test_case: LLMTestCase) -> tuple[int | float, str]:
-        text = """"""
-        for param in self.evaluation_params:
-            value = getattr(test_case, param.value)
-            text += f"{G_EVAL_PARAMS[param]}:\n{value} \n\n"
+    async def _a_cascade(self, test_case: LLMTestCase) -> JudgeVerdict:
+        # Both tiers judge against the same (possibly just generated) steps
+        self.cascade_metric.evaluation_steps = self.evaluation_steps
+        first = await self.cascade_metric._a_judge(test_case)
+        if self._cascade_confident(first):
+            self.cascade_stats.record(escalated=False)
+            return first._replace(escalated=False)
 
-        g_eval_params_str = construct_comparison_g_eval_params_string(
-            self.evaluation_params)
-        prompt = ComparisonGEvalTemplate.generate_evaluation_results(
-            evaluation_steps=self.number_evaluation_steps(),
-            text=text,
-            parameters=g_eval_params_str,
-        )
+        verdict = await self._a_judge(test_case)
+        self.cascade_stats.record(escalated=True, agreed=self._same_score(first, verdict))
+        return verdict._replace(cost=self._sum_costs(first.cost, verdict.cost), escalated=True)
+
+    def _cascade(self, test_case: LLMTestCase) -> JudgeVerdict:
+        self.cascade_metric.evaluation_steps = self.evaluation_steps
+        first = self.cascade_metric._judge(test_case)
+        if self._cascade_confident(first):
+            self.cascade_stats.record(escalated=False)
+            return first._replace(escalated=False)
+
+        verdict = self._judge(test_case)
+        self.cascade_stats.record(escalated=True, agreed=self._same_score(first, verdict))
+        return verdict._replace(cost=self._sum_costs(first.cost, verdict.cost), escalated=True)
+
+    def _cascade_confident(self, verdict: JudgeVerdict) -> bool:
+        # Without logprobs or votes the cascade model's confidence is unknown, so escalate
+        confidence = self.cascade_metric.build_result(verdict, 0, 0).confidence
+        return confidence is not None and confidence >= self.escalation_threshold
+
+    @staticmethod
+    def _same_score(first: JudgeVerdict, second: JudgeVerdict) -> bool:
+        return ComparisonGEvalTemplate.calculate_score(first.choice) == \
+            ComparisonGEvalTemplate.calculate_score(second.choice)
+
+    @staticmethod
+    def _sum_costs(*costs) -> float | None:
+        if all(cost is None for cost in costs):
+            return None
+        return sum(cost or 0 for cost in costs)
 
+    async def _a_judge(self, test_case: LLMTestCase) -> JudgeVerdict:
+        prompt = self._judge_prompt(self._params_text(test_case))
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return JudgeVerdict(cached["choice"], cached["reason"], cached.get("choice_probs"), 0, cached.get("samples"))
+
+        if self.samples > 1:
+            verdict = await self._a_vote(prompt)
+            if key is not None:
+                self.cache.set(key, {
+                    "choice": verdict.choice,
+                    "reason": verdict.reason,
+                    "choice_probs": verdict.choice_probs,
+                    "samples": verdict.samples,
+                })
+            return verdict
+
+        tokens = estimate_tokens(prompt, self._max_tokens())
+        if self.rate_limiter is not None:
+            await self.rate_limiter.a_acquire(tokens)
+        launched = []
+
+        async def attempt() -> JudgeVerdict:
+            # A hedged duplicate spends rate budget like any other call
+            if launched and self.rate_limiter is not None:
+                await self.rate_limiter.a_acquire(tokens)
+            launched.append(True)
+            start = time.perf_counter()
+            # Each attempt is its own task, so this only counts waits inside the model call
+            limiter_wait.set(0.0)
+            if self.include_reason:
+                verdict = await self._a_call_judge(prompt)
+            else:
+                verdict = await self._a_call_choice_judge(prompt)
+            # Time queued behind a model's own rate limiter isn't provider latency
+            self.latency_tracker.record(time.perf_counter() - start - limiter_wait.get())
+            return verdict
+
+        verdict = await hedged_call(
+            attempt, timeout=self.timeout, hedge_after=self._hedge_delay())
+        if key is not None:
+            self.cache.set(key, {
+                "choice": verdict.choice,
+                "reason": verdict.reason,
+                "choice_probs": verdict.choice_probs,
+                "samples": verdict.samples,
+            })
+            if prompt in self._streamed_reasons:
+                # Fill in the reason once the rest of the stream has arrived
+                self._streamed_reasons[prompt] = asyncio.ensure_future(
+                    self._a_cache_streamed_reason(key, verdict, self._streamed_reasons[prompt]))
+        return verdict
+
+    async def _a_cache_streamed_reason(self, key: str, verdict: JudgeVerdict, reason_task: asyncio.Task) -> str | None:
+        reason = await reason_task
+        if reason:
+            self.cache.set(key, {
+                "choice": verdict.choice,
+                "reason": reason,
+                "choice_probs": verdict.choice_probs,
+                "samples": verdict.samples,
+            })
+        return reason
+
+    async def _a_call_judge(self, prompt: str) -> JudgeVerdict:
+        if self.stream and hasattr(self.model, "a_stream"):
+            return await self._a_call_streaming_judge(prompt)
         try:
             # Don't have to check for using native model
             # since generate raw response only exist for deepeval's native model
             res, cost = await self.model.a_generate_raw_response(
                 prompt, logprobs=True, top_logprobs=20
             )
-            self.evaluation_cost += cost
-            data = trimAndLoadJson(res.content, self)
-            reason = data["reason"]
-            score = ComparisonGEvalTemplate.calculate_score(data["choice"])
-
-            return score, reason
+            choice, reason = await self._a_load_verdict(raw_response_content(res))
+            choice_probs = extract_choice_probs(extract_token_logprobs(res))
+            return JudgeVerdict(choice, reason, choice_probs, cost)
 
         # This catches the case where a_generate_raw_response doesn't exist.
         except AttributeError:
             if self.using_native_model:
                 res, cost = await self.model.a_generate(prompt)
-                self.evaluation_cost += cost
-                data = trimAndLoadJson(res, self)
-                score = ComparisonGEvalTemplate.calculate_score(data["choice"])
-                reason = data["reason"]
-                return score, reason
+                choice, reason = await self._a_load_verdict(res)
+                return JudgeVerdict(choice, reason, None, cost)
             else:  # noqa: RET505
                 try:
                     res: ReasonScore = await self.model.a_generate(prompt, schema=ReasonScore)
-                    score = ComparisonGEvalTemplate.calculate_score(res.choice)
-                    reason = res.reason
-                    return score, reason
+                    return JudgeVerdict(res.choice, res.reason, None, None)
                 except TypeError:
                     res = await self.model.a_generate(prompt)
-                    data = trimAndLoadJson(res, self)
-                    score = ComparisonGEvalTemplate.calculate_score(
-                        data["choice"])
-                    reason = data["reason"]
-                    return score, reason
+                    choice, reason = await self._a_load_verdict(res)
+                    return JudgeVerdict(choice, reason, None, None)
 
-    def evaluate(self, test_case: LLMTestCase) -> tuple[int | float, str]:
+    async def _a_call_streaming_judge(self, prompt: str) -> JudgeVerdict:
+        # Streamed responses carry no logprobs, so there is no choice distribution here
+        stream = self.model.a_stream(prompt)
+        parser = StreamingChoiceParser()
+        try:
+            async for delta in stream:
+                if parser.feed(delta) is not None:
+                    break
+            else:
+                # The stream ended before a well-formed choice field; parse what arrived
+                choice, reason = await self._a_load_verdict(parser.text)
+                return JudgeVerdict(choice, reason, None, None)
+        except BaseException:
+            # Including cancellation as the losing hedge: stop the server generating
+            await stream.aclose()
+            raise
+
+        if self.stream_reasons:
+            # One reason stream per prompt; a hedged duplicate's is stopped
+            previous = self._streamed_reasons.get(prompt)
+            self._streamed_reasons[prompt] = asyncio.ensure_future(
+                self._a_finish_stream(stream, parser))
+            if previous is not None:
+                previous.cancel()
+        else:
+            await stream.aclose()
+        return JudgeVerdict(parser.choice, None, None, None)
+
+    @staticmethod
+    async def _a_finish_stream(stream, parser: StreamingChoiceParser) -> str | None:
+        try:
+            async for delta in stream:
+                parser.feed(delta)
+        finally:
+            # A cancelled tail (no reason needed after all) closes the stream too
+            await stream.aclose()
+        return parser.reason()
+
+    async def _a_call_choice_judge(self, prompt: str) -> JudgeVerdict:
+        try:
+            res, cost = await self.model.a_generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20, max_tokens=CHOICE_ONLY_MAX_TOKENS
+            )
+            choice = ComparisonGEvalTemplate.parse_choice(raw_response_content(res))
+            choice_probs = extract_choice_probs(
+                extract_token_logprobs(res), json_output=False)
+            return JudgeVerdict(choice, None, choice_probs, cost)
+
+        # Models without raw responses can't cap output tokens, but the parser still copes
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = await self.model.a_generate(prompt)
+            else:
+                res, cost = await self.model.a_generate(prompt), None
+            return JudgeVerdict(ComparisonGEvalTemplate.parse_choice(res), None, None, cost)
+
+    def _judge(self, test_case: LLMTestCase) -> JudgeVerdict:
         text = """"""
         for param in self.evaluation_params:
             value = getattr(test_case, param.value)
             text += f"{param.value}: {value} \n\n"
 
-        g_eval_params_str = construct_comparison_g_eval_params_string(
-            self.evaluation_params)
+        prompt = self._judge_prompt(text)
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return JudgeVerdict(cached["choice"], cached["reason"], cached.get("choice_probs"), 0, cached.get("samples"))
 
-        prompt = ComparisonGEvalTemplate.generate_evaluation_results(
-            evaluation_steps=self.number_evaluation_steps(),
-            text=text,
-            parameters=g_eval_params_str,
-        )
+        if self.samples > 1:
+            verdict = self._vote(prompt)
+        else:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimate_tokens(prompt, self._max_tokens()))
+            if self.include_reason:
+                verdict = self._call_judge(prompt)
+            else:
+                verdict = self._call_choice_judge(prompt)
+        if key is not None:
+            self.cache.set(key, {
+                "choice": verdict.choice,
+                "reason": verdict.reason,
+                "choice_probs": verdict.choice_probs,
+                "samples": verdict.samples,
+            })
+        return verdict
 
+    def _call_judge(self, prompt: str) -> JudgeVerdict:
         try:
             res, cost = self.model.generate_raw_response(
                 prompt, logprobs=True, top_logprobs=20)
-            self.evaluation_cost += cost
-            data = trimAndLoadJson(res.content, self)
-
-            reason = data["reason"]
-            score = ComparisonGEvalTemplate.calculate_score(data["choice"])
-
-            return score, reason
+            choice, reason = self._load_verdict(raw_response_content(res))
+            choice_probs = extract_choice_probs(extract_token_logprobs(res))
+            return JudgeVerdict(choice, reason, choice_probs, cost)
 
         except AttributeError:
             # This catches the case where a_generate_raw_response doesn't exist.
             if self.using_native_model:
                 res, cost = self.model.generate(prompt)
-                self.evaluation_cost += cost
-                data = trimAndLoadJson(res, self)
-                return ComparisonGEvalTemplate.calculate_score(data["choice"]), data["reason"]
+                choice, reason = self._load_verdict(res)
+                return JudgeVerdict(choice, reason, None, cost)
             else:  # noqa: RET505
                 try:
                     res: ReasonScore = self.model.generate(
                         prompt, schema=ReasonScore)
-                    score = ComparisonGEvalTemplate.calculate_score(res.choice)
-                    reason = res.reason
-                    return score, reason
+                    return JudgeVerdict(res.choice, res.reason, None, None)
                 except TypeError:
                     res = self.model.generate(prompt)
-                    data = trimAndLoadJson(res, self)
-                    score = ComparisonGEvalTemplate.calculate_score(
-                        data["choice"])
-                    reason = data["reason"]
-                    return score, reason
+                    choice, reason = self._load_verdict(res)
+                    return JudgeVerdict(choice, reason, None, None)
+
+    def _call_choice_judge(self, prompt: str) -> JudgeVerdict:
+        try:
+            res, cost = self.model.generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20, max_tokens=CHOICE_ONLY_MAX_TOKENS)
+            choice = ComparisonGEvalTemplate.parse_choice(raw_response_content(res))
+            choice_probs = extract_choice_probs(
+                extract_token_logprobs(res), json_output=False)
+            return JudgeVerdict(choice, None, choice_probs, cost)
+
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = self.model.generate(prompt)
+            else:
+                res, cost = self.model.generate(prompt), None
+            return JudgeVerdict(ComparisonGEvalTemplate.parse_choice(res), None, None, cost)
+
+    async def _a_judge_batch(self, test_cases: list[LLMTestCase]) -> list[JudgeVerdict | None]:
+        prompt = self._batch_judge_prompt(test_cases)
+        key = self._cache_key(prompt, batch=True)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._cached_batch_verdicts(cached)
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.a_acquire(
+                estimate_tokens(prompt, DEFAULT_OUTPUT_TOKENS * len(test_cases)))
+        try:
+            res, cost = await self.model.a_generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20)
+            verdicts = self._parse_batch(
+                raw_response_content(res), extract_token_logprobs(res), len(test_cases), cost)
+        # This catches the case where a_generate_raw_response doesn't exist.
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = await self.model.a_generate(prompt)
+            else:
+                res, cost = await self.model.a_generate(prompt), None
+            verdicts = self._parse_batch(res, None, len(test_cases), cost)
+        if key is not None:
+            self.cache.set(key, self._batch_cache_value(verdicts))
+        return verdicts
+
+    def _judge_batch(self, test_cases: list[LLMTestCase]) -> list[JudgeVerdict | None]:
+        prompt = self._batch_judge_prompt(test_cases)
+        key = self._cache_key(prompt, batch=True)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._cached_batch_verdicts(cached)
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                estimate_tokens(prompt, DEFAULT_OUTPUT_TOKENS * len(test_cases)))
+        try:
+            res, cost = self.model.generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20)
+            verdicts = self._parse_batch(
+                raw_response_content(res), extract_token_logprobs(res), len(test_cases), cost)
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = self.model.generate(prompt)
+            else:
+                res, cost = self.model.generate(prompt), None
+            verdicts = self._parse_batch(res, None, len(test_cases), cost)
+        if key is not None:
+            self.cache.set(key, self._batch_cache_value(verdicts))
+        return verdicts
+
+    def _batch_judge_prompt(self, test_cases: list[LLMTestCase]) -> str:
+        items = []
+        for index, test_case in enumerate(test_cases, start=1):
+            text = """"""
+            for param in self.evaluation_params:
+                value = getattr(test_case, param.value)
+                text += f"{G_EVAL_PARAMS[param]}:\n{value} \n\n"
+            items.append((str(index), text))
+        return ComparisonGEvalTemplate.generate_batch_evaluation_results(
+            evaluation_steps=self.number_evaluation_steps(),
+            items=items,
+            parameters=construct_comparison_g_eval_params_string(
+                self.evaluation_params),
+            include_reason=self.include_reason,
+        )
+
+    def _parse_batch(self, content: str, token_logprobs, count: int, cost) -> list[JudgeVerdict | None]:
+        """One verdict per test case, or None where the judge's answer is unusable."""
+        verdicts = [None] * count
+        try:
+            data, _ = load_json(content)
+        except ValueError:
+            return verdicts
+        entries = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            return verdicts
+
+        # Logprobs can only be attributed when every entry has exactly one choice token
+        choice_probs = list(iter_choice_probs(token_logprobs))
+        if len(choice_probs) != len(entries):
+            choice_probs = [None] * len(entries)
+        item_cost = cost / count if cost is not None else None
+        for entry, probs in zip(entries, choice_probs):
+            try:
+                index = int(entry["id"]) - 1
+                choice = str(entry["choice"]).strip()
+            except (KeyError, TypeError, ValueError):
+                continue
+            reason = entry.get("reason") if self.include_reason else None
+            if not 0 <= index < count or verdicts[index] is not None:
+                continue
+            if choice not in CHOICE_LETTERS or (self.include_reason and not reason):
+                continue
+            verdicts[index] = JudgeVerdict(choice, reason, probs, item_cost)
+        return verdicts
+
+    @staticmethod
+    def _batch_cache_value(verdicts: list[JudgeVerdict | None]) -> dict:
+        return {"verdicts": [
+            None if verdict is None else {
+                "choice": verdict.choice,
+                "reason": verdict.reason,
+                "choice_probs": verdict.choice_probs,
+            }
+            for verdict in verdicts
+        ]}
+
+    @staticmethod
+    def _cached_batch_verdicts(cached: dict) -> list[JudgeVerdict | None]:
+        return [
+            None if verdict is None else JudgeVerdict(
+                verdict["choice"], verdict["reason"], verdict.get("choice_probs"), 0)
+            for verdict in cached["verdicts"]
+        ]
+
+    async def _a_vote(self, prompt: str) -> JudgeVerdict:
+        votes = []
+        cost = 0
+        while len(votes) < self.samples:
+            k = min(self.samples_per_round, self.samples - len(votes))
+            round_votes, round_cost = await self._a_sample(prompt, k, seed=len(votes))
+            votes += round_votes
+            cost += round_cost or 0
+            if votes and vote_settled(self._score_votes(votes), self.samples - len(votes)):
+                break
+        return self._tally(votes, cost)
+
+    def _vote(self, prompt: str) -> JudgeVerdict:
+        votes = []
+        cost = 0
+        while len(votes) < self.samples:
+            k = min(self.samples_per_round, self.samples - len(votes))
+            round_votes, round_cost = self._sample(prompt, k, seed=len(votes))
+            votes += round_votes
+            cost += round_cost or 0
+            if votes and vote_settled(self._score_votes(votes), self.samples - len(votes)):
+                break
+        return self._tally(votes, cost)
+
+    async def _a_sample(self, prompt: str, k: int, seed: int) -> tuple[list[tuple[str, str | None]], float | None]:
+        """``k`` (choice, reason) votes, from one ``n=k`` request where the model allows it."""
+        if self._samples_with_n():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.a_acquire(self._sample_tokens(prompt, k))
+            # The seed differs per round, so cached rounds don't repeat each other
+            res, cost = await self.model.a_generate_raw_response(
+                prompt, n=k, seed=seed, **self._sample_kwargs())
+            return self._parse_votes(res), cost
+
+        async def call():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.a_acquire(self._sample_tokens(prompt, 1))
+            if self.include_reason:
+                return await self._a_call_judge(prompt)
+            else:  # noqa: RET505
+                return await self._a_call_choice_judge(prompt)
+
+        verdicts = await asyncio.gather(*(call() for _ in range(k)))
+        return [(v.choice, v.reason) for v in verdicts], self._add_costs(*(v.cost for v in verdicts))
+
+    def _sample(self, prompt: str, k: int, seed: int) -> tuple[list[tuple[str, str | None]], float | None]:
+        if self._samples_with_n():
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self._sample_tokens(prompt, k))
+            res, cost = self.model.generate_raw_response(
+                prompt, n=k, seed=seed, **self._sample_kwargs())
+            return self._parse_votes(res), cost
+
+        votes = []
+        cost = 0
+        for _ in range(k):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(self._sample_tokens(prompt, 1))
+            if self.include_reason:
+                verdict = self._call_judge(prompt)
+            else:
+                verdict = self._call_choice_judge(prompt)
+            votes.append((verdict.choice, verdict.reason))
+            cost += verdict.cost or 0
+        return votes, cost
+
+    def _samples_with_n(self) -> bool:
+        # deepeval's native models go through langchain, which only hands back the first of n completions
+        return not self.using_native_model and hasattr(self.model, "generate_raw_response")
+
+    def _sample_kwargs(self) -> dict:
+        return {} if self.include_reason else {"max_tokens": CHOICE_ONLY_MAX_TOKENS}
+
+    def _sample_tokens(self, prompt: str, k: int) -> int:
+        return estimate_tokens(prompt, self._max_tokens(), k)
+
+    def _parse_votes(self, res) -> list[tuple[str, str | None]]:
+        votes = []
+        for choice in res.choices:
+            content = choice.message.content
+            # A garbled sample just doesn't get a vote
+            try:
+                if self.include_reason:
+                    votes.append(parse_reason_score(content)[:2])
+                else:
+                    votes.append((ComparisonGEvalTemplate.parse_choice(content), None))
+            except (ValueError, KeyError, TypeError):
+                continue
+        return [vote for vote in votes if vote[0] in CHOICE_LETTERS]
+
+    @staticmethod
+    def _score_votes(votes: list[tuple[str, str | None]]) -> Counter:
+        # C and E (and D and G) score the same, so they vote together
+        return Counter(ComparisonGEvalTemplate.calculate_score(choice) for choice, _ in votes)
+
+    def _tally(self, votes: list[tuple[str, str | None]], cost) -> JudgeVerdict:
+        if not votes:
+            raise ValueError("Evaluation LLM returned no usable choice in any sample.")
+        winning_score = self._score_votes(votes).most_common(1)[0][0]
+        winners = [vote for vote in votes
+                   if ComparisonGEvalTemplate.calculate_score(vote[0]) == winning_score]
+        choice = Counter(vote[0] for vote in winners).most_common(1)[0][0]
+        reason = next((r for c, r in winners if c == choice and r), None)
+        choice_counts = Counter(vote[0] for vote in votes)
+        choice_probs = {c: count / len(votes) for c, count in choice_counts.items()}
+        return JudgeVerdict(choice, reason, choice_probs, cost, len(votes))
+
+    async def _a_load_verdict(self, content: str) -> tuple[str, str | None]:
+        """Choice and reason from a judge response, repairing it or re-asking if need be."""
+        try:
+            return self._parse_verdict(content)
+        except ValueError:
+            pass
+        # Only output with no recoverable choice at all is worth a (short) round-trip
+        self.parse_stats.record("reasked")
+        prompt = ComparisonGEvalTemplate.generate_json_repair(content)
+        if self.using_native_model:
+            res, _ = await self.model.a_generate(prompt)
+        else:
+            res = await self.model.a_generate(prompt)
+        try:
+            return self._parse_verdict(res)
+        except ValueError:
+            self.parse_stats.record("failed")
+            raise
+
+    def _load_verdict(self, content: str) -> tuple[str, str | None]:
+        try:
+            return self._parse_verdict(content)
+        except ValueError:
+            pass
+        self.parse_stats.record("reasked")
+        prompt = ComparisonGEvalTemplate.generate_json_repair(content)
+        if self.using_native_model:
+            res, _ = self.model.generate(prompt)
+        else:
+            res = self.model.generate(prompt)
+        try:
+            return self._parse_verdict(res)
+        except ValueError:
+            self.parse_stats.record("failed")
+            raise
+
+    def _parse_verdict(self, content: str) -> tuple[str, str | None]:
+        choice, reason, repaired = parse_reason_score(content)
+        self.parse_stats.record("repaired" if repaired else "clean")
+        return choice, reason
+
+    def _params_text(self, test_case: LLMTestCase) -> str:
+        text = """"""
+        for param in self.evaluation_params:
+            value = getattr(test_case, param.value)
+            text += f"{G_EVAL_PARAMS[param]}:\n{value} \n\n"
+        return text
+
+    def _judge_prompt(self, text: str) -> str:
+        g_eval_params_str = construct_comparison_g_eval_params_string(
+            self.evaluation_params)
+        if self.include_reason:
+            generate_prompt = ComparisonGEvalTemplate.generate_evaluation_results
+        else:
+            generate_prompt = ComparisonGEvalTemplate.generate_choice_only_results
+        return generate_prompt(
+            evaluation_steps=self.number_evaluation_steps(),
+            text=text,
+            parameters=g_eval_params_str,
+        )
+
+    async def a_explain(self, test_case: LLMTestCase, choice: str) -> str:
+        """Ask the judge why ``test_case`` earns ``choice``.
+
+        Used with ``include_reason=False`` to fetch reasons lazily, only for
+        the results that need one.
+        """
+        text = self._params_text(test_case)
+
+        # A streamed verdict may still be delivering its reason
+        reason_task = self._streamed_reasons.pop(self._judge_prompt(text), None)
+        if reason_task is not None:
+            reason = await reason_task
+            if reason:
+                return reason
+
+        prompt = ComparisonGEvalTemplate.generate_choice_reason(
+            evaluation_steps=self.number_evaluation_steps(),
+            text=text,
+            parameters=construct_comparison_g_eval_params_string(
+                self.evaluation_params),
+            choice=choice,
+        )
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached["reason"]
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.a_acquire(estimate_tokens(prompt))
+        if self.using_native_model:
+            res, _ = await self.model.a_generate(prompt)
+        else:
+            res = await self.model.a_generate(prompt)
+        reason = res.strip()
+        if key is not None:
+            self.cache.set(key, {"reason": reason})
+        return reason
+
+    async def a_close_streams(self, test_cases: list[LLMTestCase] | None = None):
+        """Stop streaming the reasons ``a_explain`` won't be asked for: those of ``test_cases``, or all still open."""
+        if test_cases is None:
+            tasks = list(self._streamed_reasons.values())
+            self._streamed_reasons.clear()
+        else:
+            prompts = {self._judge_prompt(self._params_text(test_case)) for test_case in test_cases}
+            tasks = [self._streamed_reasons.pop(prompt) for prompt in prompts if prompt in self._streamed_reasons]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def explain(self, test_case: LLMTestCase, choice: str) -> str:
+        loop = get_or_create_event_loop()
+        return loop.run_until_complete(self.a_explain(test_case, choice))
+
+    def _check_sync_deadlines(self):
+        # A blocking call can't be abandoned or raced, so deadlines would silently not apply
+        if self.timeout is not None or self.hedge_quantile is not None:
+            raise ValueError("'timeout' and 'hedge_quantile' only apply to async judging; "
+                             "use a_measure_result or async_mode=True.")
+
+    def _hedge_delay(self) -> float | None:
+        # Until enough calls have been timed, the percentile is just noise
+        if self.hedge_quantile is None or len(self.latency_tracker) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency_tracker.percentile(self.hedge_quantile)
+
+    def _max_tokens(self) -> int | None:
+        return None if self.include_reason else CHOICE_ONLY_MAX_TOKENS
+
+    def _cache_key(self, prompt: str, batch: bool = False) -> str | None:
+        if self.cache is None:
+            return None
+        params = {"logprobs": True, "top_logprobs": 20}
+        # Batched calls leave room for every test case's answer
+        if not self.include_reason and not batch:
+            params["max_tokens"] = CHOICE_ONLY_MAX_TOKENS
+        if self.stream and self.include_reason and not batch:
+            # Streamed verdicts have no logprobs and may have been cut short before the reason
+            params = {"stream": True, "stream_reasons": self.stream_reasons}
+        if self.samples > 1 and not batch:
+            params["samples"] = self.samples
+            params["samples_per_round"] = self.samples_per_round
+        return JudgeCache.make_key(self.evaluation_model, prompt, params)
+
+    def evaluate(self, test_case: LLMTestCase) -> tuple[int | float, str]:
+        result = self.measure_result(test_case)
+        return result.score, result.reason
 
     def number_evaluation_steps(self):
         evaluation_steps = """"""
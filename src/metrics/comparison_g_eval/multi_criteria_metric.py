@@ -0,0 +1,326 @@
+"""Several ComparisonGEval criteria judged together in one LLM call per test case."""
+
+import asyncio
+import time
+
+from deepeval.metrics import BaseMetric
+from deepeval.metrics.indicator import metric_progress_indicator
+from deepeval.metrics.utils import (
+    check_llm_test_case_params,
+    construct_verbose_logs,
+    initialize_model,
+)
+from deepeval.models import DeepEvalBaseLLM
+from deepeval.test_case import (
+    LLMTestCase,
+    LLMTestCaseParams,
+)
+from deepeval.utils import get_or_create_event_loop
+
+from src.metrics.comparison_g_eval.comparison_g_eval_metric import (
+    CHOICE_LETTERS,
+    G_EVAL_PARAMS,
+    ComparisonGEval,
+    JudgeVerdict,
+    construct_comparison_g_eval_params_string,
+    extract_token_logprobs,
+    iter_choice_probs,
+    raw_response_content,
+)
+from src.metrics.comparison_g_eval.parser import load_json
+from src.metrics.comparison_g_eval.schema import (
+    ComparisonGEvalResult,
+    MultiCriteriaComparisonGEvalResult,
+)
+from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
+from src.utils.judge_cache import JudgeCache
+from src.utils.rate_limiter import DEFAULT_OUTPUT_TOKENS, estimate_tokens
+
+
+class MultiCriteriaComparisonGEval(BaseMetric):
+    """Judges a test case against several named step-lists with a single request.
+
+    Each criterion is also a ``ComparisonGEval`` in ``self.metrics``, so after
+    ``measure`` its score, threshold, success and reason read exactly like an
+    independent metric's. Criteria the judge's answer leaves out or garbles
+    are re-scored with their own single-criterion call.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        evaluation_params: list[LLMTestCaseParams],
+        criteria: dict[str, list[str]],
+        model: str | DeepEvalBaseLLM | None = None,
+        threshold: float = 0.5,
+        thresholds: dict[str, float] | None = None,
+        async_mode: bool = True,
+        strict_mode: bool = False,
+        verbose_mode: bool = False,
+        cache: JudgeCache | None = None,
+        score_mode: str = "choice",
+        _include_g_eval_suffix: bool = True,
+    ):
+        if not criteria:
+            raise ValueError("'criteria' must map at least one name to its evaluation steps.")
+
+        self.name = name
+        self.evaluation_params = evaluation_params
+        self.model, self.using_native_model = initialize_model(model)
+        self.evaluation_model = self.model.get_model_name()
+        self.threshold = 1 if strict_mode else threshold
+        self.strict_mode = strict_mode
+        self.async_mode = async_mode
+        self.verbose_mode = verbose_mode
+        thresholds = thresholds or {}
+        self.metrics = {
+            criterion: ComparisonGEval(
+                name=criterion,
+                evaluation_params=evaluation_params,
+                evaluation_steps=evaluation_steps,
+                model=self.model,
+                threshold=thresholds.get(criterion, threshold),
+                async_mode=async_mode,
+                strict_mode=strict_mode,
+                verbose_mode=verbose_mode,
+                cache=cache,
+                score_mode=score_mode,
+                _include_g_eval_suffix=False,
+            )
+            for criterion, evaluation_steps in criteria.items()
+        }
+        # The criteria share one model, so they share its cache and rate limiter too
+        first = next(iter(self.metrics.values()))
+        self.using_native_model = first.using_native_model
+        self.cache = first.cache
+        self.rate_limiter = first.rate_limiter
+        self._include_g_eval_suffix = _include_g_eval_suffix
+
+    def measure(self, test_case: LLMTestCase, _show_indicator: bool = True) -> float:
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        with metric_progress_indicator(self, _show_indicator=_show_indicator):
+            if self.async_mode:
+                loop = get_or_create_event_loop()
+                result = loop.run_until_complete(
+                    self.a_measure_result(test_case))
+            else:
+                result = self.measure_result(test_case)
+            self._apply_result(result)
+            return self.score
+
+    async def a_measure(
+        self,
+        test_case: LLMTestCase,
+        _show_indicator: bool = True,
+    ) -> float:
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        with metric_progress_indicator(
+            self,
+            async_mode=True,
+            _show_indicator=_show_indicator,
+        ):
+            result = await self.a_measure_result(test_case)
+            self._apply_result(result)
+            return self.score
+
+    def measure_result(self, test_case: LLMTestCase) -> MultiCriteriaComparisonGEvalResult:
+        """Score every criterion without writing to the metric instances."""
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        start = time.perf_counter()
+        verdicts, cost = self._judge(test_case)
+        latency = time.perf_counter() - start
+        results = {}
+        for criterion, metric in self.metrics.items():
+            if verdicts.get(criterion) is None:
+                results[criterion] = metric.measure_result(test_case)
+            else:
+                results[criterion] = metric.build_result(verdicts[criterion], 0, latency)
+        return self.build_result(results, cost, time.perf_counter() - start)
+
+    async def a_measure_result(self, test_case: LLMTestCase) -> MultiCriteriaComparisonGEvalResult:
+        """Async counterpart of ``measure_result``."""
+        check_llm_test_case_params(test_case, self.evaluation_params, self)
+
+        start = time.perf_counter()
+        verdicts, cost = await self._a_judge(test_case)
+        latency = time.perf_counter() - start
+        missing = [criterion for criterion in self.metrics if verdicts.get(criterion) is None]
+        fallbacks = await asyncio.gather(*(
+            self.metrics[criterion].a_measure_result(test_case) for criterion in missing))
+        results = dict(zip(missing, fallbacks))
+        for criterion, metric in self.metrics.items():
+            if criterion not in results:
+                results[criterion] = metric.build_result(verdicts[criterion], 0, latency)
+        return self.build_result(
+            {criterion: results[criterion] for criterion in self.metrics},
+            cost, time.perf_counter() - start)
+
+    def build_result(self, results: dict[str, ComparisonGEvalResult], cost, latency) -> MultiCriteriaComparisonGEvalResult:
+        score = sum(result.score for result in results.values()) / len(results)
+        costs = [cost] + [result.cost for result in results.values()]
+        return MultiCriteriaComparisonGEvalResult(
+            score=score,
+            success=all(result.success for result in results.values()),
+            criteria=results,
+            cost=sum(c or 0 for c in costs) if self.using_native_model else None,
+            latency=latency,
+        )
+
+    def _apply_result(self, result: MultiCriteriaComparisonGEvalResult):
+        for criterion, metric in self.metrics.items():
+            metric._apply_result(result.criteria[criterion])
+        self.score = result.score
+        self.success = result.success
+        self.score_breakdown = {
+            criterion: criterion_result.score for criterion, criterion_result in result.criteria.items()}
+        self.reason = "\n".join(
+            f"{criterion}: {criterion_result.reason}"
+            for criterion, criterion_result in result.criteria.items())
+        self.evaluation_cost = result.cost
+        self.verbose_logs = construct_verbose_logs(
+            self,
+            steps=[
+                "Criteria:\n" + "\n".join(
+                    f"{criterion} (threshold {metric.threshold})" for criterion, metric in self.metrics.items()),
+                f"Score: {self.score}\nReason:\n{self.reason}",
+            ],
+        )
+
+    async def _a_judge(self, test_case: LLMTestCase) -> tuple[dict[str, JudgeVerdict], float | None]:
+        prompt = self._judge_prompt(test_case)
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._cached_verdicts(cached), 0
+
+        if self.rate_limiter is not None:
+            await self.rate_limiter.a_acquire(
+                estimate_tokens(prompt, DEFAULT_OUTPUT_TOKENS * len(self.metrics)))
+        try:
+            res, cost = await self.model.a_generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20)
+            verdicts = self._parse_verdicts(
+                raw_response_content(res), extract_token_logprobs(res))
+        # This catches the case where a_generate_raw_response doesn't exist.
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = await self.model.a_generate(prompt)
+            else:
+                res, cost = await self.model.a_generate(prompt), None
+            verdicts = self._parse_verdicts(res, None)
+        if key is not None:
+            self.cache.set(key, self._cache_value(verdicts))
+        return verdicts, cost
+
+    def _judge(self, test_case: LLMTestCase) -> tuple[dict[str, JudgeVerdict], float | None]:
+        prompt = self._judge_prompt(test_case)
+        key = self._cache_key(prompt)
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._cached_verdicts(cached), 0
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(
+                estimate_tokens(prompt, DEFAULT_OUTPUT_TOKENS * len(self.metrics)))
+        try:
+            res, cost = self.model.generate_raw_response(
+                prompt, logprobs=True, top_logprobs=20)
+            verdicts = self._parse_verdicts(
+                raw_response_content(res), extract_token_logprobs(res))
+        except AttributeError:
+            if self.using_native_model:
+                res, cost = self.model.generate(prompt)
+            else:
+                res, cost = self.model.generate(prompt), None
+            verdicts = self._parse_verdicts(res, None)
+        if key is not None:
+            self.cache.set(key, self._cache_value(verdicts))
+        return verdicts, cost
+
+    def _judge_prompt(self, test_case: LLMTestCase) -> str:
+        text = """"""
+        for param in self.evaluation_params:
+            value = getattr(test_case, param.value)
+            text += f"{G_EVAL_PARAMS[param]}:\n{value} \n\n"
+
+        return ComparisonGEvalTemplate.generate_multi_criteria_results(
+            criteria=[(criterion, metric.number_evaluation_steps())
+                      for criterion, metric in self.metrics.items()],
+            text=text,
+            parameters=construct_comparison_g_eval_params_string(
+                self.evaluation_params),
+        )
+
+    def _parse_verdicts(self, content: str, token_logprobs) -> dict[str, JudgeVerdict]:
+        """Verdicts by criterion name; criteria missing from the answer are left out."""
+        try:
+            data, _ = load_json(content)
+        except ValueError:
+            return {}
+        entries = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            return {}
+
+        # Logprobs can only be attributed when every entry has exactly one choice token
+        choice_probs = list(iter_choice_probs(token_logprobs))
+        if len(choice_probs) != len(entries):
+            choice_probs = [None] * len(entries)
+        verdicts = {}
+        for entry, probs in zip(entries, choice_probs):
+            try:
+                criterion = str(entry["criterion"]).strip()
+                choice = str(entry["choice"]).strip()
+                reason = entry["reason"]
+            except (KeyError, TypeError):
+                continue
+            if criterion in self.metrics and criterion not in verdicts and choice in CHOICE_LETTERS:
+                verdicts[criterion] = JudgeVerdict(choice, reason, probs, None)
+        return verdicts
+
+    def _cache_key(self, prompt: str) -> str | None:
+        if self.cache is None:
+            return None
+        return JudgeCache.make_key(
+            self.evaluation_model, prompt, {"logprobs": True, "top_logprobs": 20})
+
+    @staticmethod
+    def _cache_value(verdicts: dict[str, JudgeVerdict]) -> dict:
+        return {"verdicts": {
+            criterion: {
+                "choice": verdict.choice,
+                "reason": verdict.reason,
+                "choice_probs": verdict.choice_probs,
+            }
+            for criterion, verdict in verdicts.items()
+        }}
+
+    @staticmethod
+    def _cached_verdicts(cached: dict) -> dict[str, JudgeVerdict]:
+        return {
+            criterion: JudgeVerdict(
+                verdict["choice"], verdict["reason"], verdict.get("choice_probs"), None)
+            for criterion, verdict in cached["verdicts"].items()
+        }
+
+    def is_successful(self) -> bool:
+        if self.error is not None:
+            self.success = False
+        else:
+            try:
+                self.success = all(
+                    metric.is_successful() for metric in self.metrics.values())
+            except:  # noqa: E722
+                self.success = False
+        return self.success
+
+    @property
+    def __name__(self):
+        if self._include_g_eval_suffix:
+            return f"{self.name} (MultiCriteriaComparisonGEval)"
+        else:
+            return self.name
@@ -0,0 +1,89 @@
+"""Tolerant parsing of judge JSON, so near-misses don't cost another LLM call."""
+
+import ast
+import json
+import re
+import threading
+
+from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
+
+FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+# Only the key is case-insensitive: choices are uppercase letters on every path, since a
+# lowercase one is more likely prose ("choice: a good essay") than a grade
+CHOICE_FIELD = re.compile(r"""["']?(?i:choice)["']?\s*[:=]\s*["']?\s*([A-H])\b""")
+REASON_FIELD = re.compile(r"""["']?(?i:reason)["']?\s*[:=]\s*(["'])(.*?)(?<!\\)\1\s*(?:[,}]|$)""", re.DOTALL)
+
+
+def load_json(text: str) -> tuple[object, bool]:
+    """Parse the JSON object in a judge response, repairing common slips.
+
+    Handles code fences, trailing commas, single quotes / Python literals
+    and a missing closing brace. Returns ``(data, repaired)`` and raises
+    ``ValueError`` when nothing parses.
+    """
+    fenced = FENCE.search(text)
+    if fenced is not None:
+        text = fenced.group(1)
+    start = text.find("{")
+    if start == -1:
+        raise ValueError("No JSON object in the evaluation LLM output.")
+    end = text.rfind("}") + 1
+    raw = text[start:end] if end > start else text[start:] + "}"
+
+    try:
+        return json.loads(raw), end <= start
+    except json.JSONDecodeError:
+        pass
+    raw = TRAILING_COMMA.sub(r"\1", raw)
+    try:
+        return json.loads(raw), True
+    except json.JSONDecodeError:
+        pass
+    # Single-quoted keys and strings are valid Python literals, and literal_eval evaluates nothing else
+    try:
+        return ast.literal_eval(raw), True
+    except (ValueError, SyntaxError):
+        raise ValueError("Evaluation LLM outputted an invalid JSON.") from None
+
+
+def parse_reason_score(text: str) -> tuple[str, str | None, bool]:
+    """``(choice, reason, repaired)`` from a ReasonScore-shaped judge response.
+
+    Falls back to pulling the fields out with regexes when the JSON can't be
+    repaired; the reason is None if only the choice survives, which also
+    counts as repaired. The choice must be an uppercase A-H either way.
+    Raises ``ValueError`` when there is no choice to be found.
+    """
+    try:
+        data, repaired = load_json(text)
+        choice = str(data["choice"]).strip()
+        if choice in ComparisonGEvalTemplate.CHOICES and len(choice) == 1:
+            reason = data.get("reason")
+            return choice, reason, repaired or reason is None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        pass
+
+    choice_match = CHOICE_FIELD.search(text)
+    if choice_match is None:
+        raise ValueError(f"Evaluation LLM output has no recoverable choice: {text!r}")
+    reason_match = REASON_FIELD.search(text)
+    return choice_match.group(1), reason_match.group(2) if reason_match else None, True
+
+
+class ParseStats:
+    """How judge responses were parsed: cleanly, after repair, after a re-ask, or not at all."""
+
+    OUTCOMES = ("clean", "repaired", "reasked", "failed")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def summary(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ReasonScore(BaseModel):
@@ -8,3 +8,37 @@ class ReasonScore(BaseModel):
 
 class Steps(BaseModel):
     steps: list[str]
+
+
+class ComparisonGEvalResult(BaseModel):
+    """Outcome of a single judge call, returned instead of mutating the metric."""
+
+    model_config = ConfigDict(frozen=True)
+
+    score: float
+    choice: str | None = None
+    reason: str | None = None
+    success: bool
+    cost: float | None = None
+    latency: float
+    # Only set when the judge returned token logprobs for the choice letter
+    choice_probs: dict[str, float] | None = None
+    entropy: float | None = None
+    confidence: float | None = None
+    # Votes drawn in self-consistency mode
+    samples: int | None = None
+    # Cascade mode: False if the cheaper cascade model's verdict was kept
+    escalated: bool | None = None
+
+
+class MultiCriteriaComparisonGEvalResult(BaseModel):
+    """Per-criterion results of one multi-criteria judge call."""
+
+    model_config = ConfigDict(frozen=True)
+
+    # Mean of the criterion scores; success only if every criterion succeeds
+    score: float
+    success: bool
+    criteria: dict[str, ComparisonGEvalResult]
+    cost: float | None = None
+    latency: float
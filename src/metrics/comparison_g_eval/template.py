@@ -1,5 +1,30 @@
 # Inspired originally by https://github.com/confident-ai/deepeval/blob/729d505c703cee93b70bf955ac0e261acf00288a/deepeval/metrics/g_eval/g_eval.py
+import math
+import re
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import ClassVar
+
+
 class ComparisonGEvalTemplate:
+    # Bump when a judging prompt changes, so stored scores from the old wording aren't reused
+    VERSION = "1"
+    CHOICES = "ABCDEFGH"
+    # A bare option letter, so "Choice: B" yields B rather than the C of "Choice"
+    CHOICE_PATTERN = re.compile(r"(?<![A-Za-z])([A-H])(?![A-Za-z])")
+    # Runs keep the raw choice letter, so this table can be re-tuned offline (see src/utils/rescore.py);
+    # read-only, so a re-tuned copy there can't leak into live metrics
+    CHOICE_SCORES: ClassVar[Mapping[str, float]] = MappingProxyType({
+        "A": 0.6,
+        "B": 0.8,
+        "C": 1,
+        "D": 0,
+        "E": 1,
+        "F": 0.2,
+        "G": 0,
+        "H": 0.4
+    })
+
     @staticmethod
     def generate_evaluation_steps(parameters, criteria):
         return f"""Given an evaluation criteria which outlines how you should judge the {parameters}, generate 3-4 concise evaluation steps based on the criteria below. You MUST make it clear how to evaluate {parameters} in relation to one another.
@@ -50,16 +75,198 @@ Example JSON:
 JSON:
 """
 
+    @staticmethod
+    def generate_batch_evaluation_results(evaluation_steps, items, parameters, include_reason=True):
+        """Judge several texts in one prompt; ``items`` is a list of (id, text) pairs."""
+        texts = "\n".join(f"[{item_id}]\n{text}" for item_id, text in items)
+        if include_reason:
+            keys = "three keys: 'id' (the text's id), 'choice' (one of the options A-H) and 'reason' (why you chose it, without mentioning any numerical scores. DO NOT QUOTE THE SCORE in your reason)"
+            example = """{
+    "results": [
+        {"id": "1", "choice": "B", "reason": "The text mostly meets the criteria outlined in the evaluation steps, but lacks some minor details."},
+        {"id": "2", "choice": "F", "reason": "The text touches on the criteria but misses most of the evaluation steps."}
+    ]
+}"""
+        else:
+            keys = "two keys: 'id' (the text's id) and 'choice' (one of the options A-H)"
+            example = """{
+    "results": [
+        {"id": "1", "choice": "B"},
+        {"id": "2", "choice": "F"}
+    ]
+}"""
+        return f"""Given the evaluation steps, assess each text below on its own and choose the most appropriate option from A to H for it, where:
+A: Partially meets the criteria
+B: Almost fully meets the criteria
+C: Fully meets all criteria
+D: Completely fails to meet the criteria
+E: Successfully meets the criteria
+F: Mostly fails to meet the criteria
+G: Unrelated to the criteria
+H: Slightly fails to meet the criteria
+
+Evaluation Steps:
+{evaluation_steps}
+
+Texts to evaluate (each starts with its id in square brackets):
+{texts}
+
+**
+IMPORTANT: Please return your response in JSON format with a single key 'results': a list with one object per text, in the order given. Each object has {keys}. Judge every text independently of the others.
+
+Example JSON:
+{example}
+**
+
+JSON:
+"""
+
+    @staticmethod
+    def generate_multi_criteria_results(criteria, text, parameters):
+        """Judge one text against several criteria; ``criteria`` is a list of (name, numbered steps) pairs."""
+        criteria_steps = "\n".join(
+            f'Criterion "{name}":\n{evaluation_steps}' for name, evaluation_steps in criteria)
+        return f"""Given the evaluation steps of each criterion below, assess the text against every criterion on its own and choose the most appropriate option from A to H for it, where:
+A: Partially meets the criteria
+B: Almost fully meets the criteria
+C: Fully meets all criteria
+D: Completely fails to meet the criteria
+E: Successfully meets the criteria
+F: Mostly fails to meet the criteria
+G: Unrelated to the criteria
+H: Slightly fails to meet the criteria
+
+Criteria and their Evaluation Steps:
+{criteria_steps}
+
+Text to evaluate:
+{text}
+
+**
+IMPORTANT: Please return your response in JSON format with a single key 'results': a list with one object per criterion, in the order given. Each object has three keys: 'criterion' (the criterion's name, exactly as given), 'choice' (one of the options A-H) and 'reason' (why you chose it, without mentioning any numerical scores. DO NOT QUOTE THE SCORE in your reason).
+
+Example JSON:
+{{
+    "results": [
+        {{"criterion": "Relevance", "choice": "B", "reason": "The text mostly stays on topic, but drifts in its final sentence."}},
+        {{"criterion": "Tone", "choice": "D", "reason": "The text is sarcastic where the steps ask for a neutral tone."}}
+    ]
+}}
+**
+
+JSON:
+"""
+
+    @staticmethod
+    def generate_choice_only_results(evaluation_steps, text, parameters):
+        return f"""Given the evaluation steps, assess the text and choose the most appropriate option from A to H, where:
+A: Partially meets the criteria
+B: Almost fully meets the criteria
+C: Fully meets all criteria
+D: Completely fails to meet the criteria
+E: Successfully meets the criteria
+F: Mostly fails to meet the criteria
+G: Unrelated to the criteria
+H: Slightly fails to meet the criteria
+
+Evaluation Steps:
+{evaluation_steps}
+
+Text to evaluate:
+{text}
+
+**
+IMPORTANT: Respond with the single letter of your choice (A-H) and nothing else. No JSON, punctuation or explanation.
+**
+
+Choice:
+"""
+
+    @staticmethod
+    def generate_choice_reason(evaluation_steps, text, parameters, choice):
+        return f"""An evaluator assessed the text below against the evaluation steps and picked option {choice} from this scale:
+A: Partially meets the criteria
+B: Almost fully meets the criteria
+C: Fully meets all criteria
+D: Completely fails to meet the criteria
+E: Successfully meets the criteria
+F: Mostly fails to meet the criteria
+G: Unrelated to the criteria
+H: Slightly fails to meet the criteria
+
+Evaluation Steps:
+{evaluation_steps}
+
+Text to evaluate:
+{text}
+
+**
+IMPORTANT: In two or three sentences, explain why the text earns option {choice}. Do not mention any numerical scores. Respond with the explanation only.
+**
+
+Reason:
+"""
+
+    @staticmethod
+    def generate_json_repair(output):
+        return f"""The evaluator output below was supposed to be a JSON object with two keys: 'choice' (one of the options A-H) and 'reason' (a short explanation), but it could not be parsed.
+
+Evaluator output:
+{output}
+
+**
+IMPORTANT: Restate the evaluator's own choice and reason as valid JSON with exactly those two keys. Do not re-evaluate anything.
+
+Example JSON:
+{{
+    "choice": "B",
+    "reason": "The text mostly meets the criteria outlined in the evaluation steps."
+}}
+**
+
+JSON:
+"""
+
+    @staticmethod
+    def parse_choice(response):
+        match = ComparisonGEvalTemplate.CHOICE_PATTERN.search(response or "")
+        if match is None:
+            raise ValueError(
+                f"Evaluation LLM did not answer with a choice from A to H: {response!r}")
+        return match.group(1)
+
     @staticmethod
     def calculate_score(choice):
-        choice_scores = {
-            "A": 0.6,
-            "B": 0.8,
-            "C": 1,
-            "D": 0,
-            "E": 1,
-            "F": 0.2,
-            "G": 0,
-            "H": 0.4
-        }
-        return choice_scores.get(choice, 0)
+        return ComparisonGEvalTemplate.CHOICE_SCORES.get(choice, 0)
+
+    @staticmethod
+    def calculate_weighted_score(choice_probs):
+        """Expected score under a {choice: probability} distribution over A-H."""
+        return sum(prob * ComparisonGEvalTemplate.calculate_score(choice)
+                   for choice, prob in choice_probs.items())
+
+    @staticmethod
+    def calculate_agreement(choice_probs):
+        """Share of the distribution behind its most likely score."""
+        score_probs = {}
+        for choice, prob in choice_probs.items():
+            score = ComparisonGEvalTemplate.calculate_score(choice)
+            score_probs[score] = score_probs.get(score, 0) + prob
+        return max(score_probs.values())
+
+    @staticmethod
+    def calculate_score_entropy(choice_probs):
+        """Entropy (nats) and confidence of the score a choice distribution implies.
+
+        Choices that map to the same score are pooled first, so a C/E split
+        is not counted as uncertainty. Confidence is 1 - normalized entropy.
+        """
+        score_probs = {}
+        for choice, prob in choice_probs.items():
+            score = ComparisonGEvalTemplate.calculate_score(choice)
+            score_probs[score] = score_probs.get(score, 0) + prob
+        entropy = -sum(prob * math.log(prob)
+                       for prob in score_probs.values() if prob > 0)
+        max_entropy = math.log(len(set(map(
+            ComparisonGEvalTemplate.calculate_score, ComparisonGEvalTemplate.CHOICES))))
+        return entropy, 1 - entropy / max_entropy
@@ -1,11 +1,27 @@
+import asyncio
 import os
 import anthropic
 import re
 import json
-import time
+from functools import cache
+import numpy as np
+from src.config import config
 from src.utils.run_essay_eval import load_dataset
+from src.utils.rate_limiter import estimate_tokens, get_rate_limiter
 import tiktoken
 
+IMPROVER_MODEL = "claude-3-5-sonnet-20240620"
+RUBRIC_BLOCK = re.compile(r"```(?:json)?\s*\n(.*?)\n?```", re.DOTALL)
+# The response announces its final rubric with this line, so examples and drafts before it are skipped
+RUBRIC_MARKER = "Updated rubric:"
+# Claude's tokenizer isn't public; cl100k_base counts close enough to budget the prompt with
+IMPROVER_ENCODING = "cl100k_base"
+# Longest excerpt of any one essay in the prompt
+ESSAY_TOKEN_LIMIT = 400
+# Share of the prompt's free budget the rubric history may take
+HISTORY_BUDGET_SHARE = 0.25
+TRUNCATION_MARKER = " [...]"
+
 SYSTEM_PROMPT = """
 You are an AI who is expert in rubric creation and human alignment. Your goal is to improve the rubric so that LLM eval scores match those of the human rater highly.
 """
@@ -13,8 +29,15 @@ You are an AI who is expert in rubric creation and human alignment. Your goal is
 PROMPT_TEMPLATE = """
 We're refining a rubric for essay grading that aligns with human rater assessments. Our goal is to improve agreement between LLM and human scores.
 
-Dataset: {dataset}
-Rubric History: {rubric_history}
+Rubric History (iteration, weighted kappa, rubric):
+{rubric_history}
+
+Last Run Statistics:
+{statistics}
+
+Largest Disagreements in the Last Run (the essays with the biggest delta between human_score and ai_score):
+{essays}
+
 Current Iteration: {current_iteration}/{max_iterations}
 Current Rubric: {current_rubric}
 Current Kappa: {current_kappa}
@@ -22,7 +45,7 @@ Target Kappa: {target_kappa}
 
 Guidelines:
 1. Analyze the current rubric and its performance.
-2. Study the last run in the rubric_history. For each row, examine the ai_reasons to understand why there might be a delta between the target human_score and the ai_score.
+2. Study the largest disagreements of the last run. For each essay, examine the ai_reasons to understand why there might be a delta between the target human_score and the ai_score.
 3. Look at these reasons individually and in aggregate to identify patterns or common issues. Remember, you are not looking for reasons why the answer is wrong, you are looking for reasons why the current rubric is not matching that of a human rater whose scores have been collected. Therefore also look to the essay text for that essay for clues. The goal is ALIGNMENT, to minimize the delta between the ai_score and the human_score on grading the essay by fine-tuning the essay grading rubric. So look at failures where there is a larger delta than others and ask yourself why the ai_score is not matching the human_score for those cases. Is it something to do with the essay text that the LLM is not matching the human rater? Perhaps some detail is being graded for that the human rater was deliberately not grading for? For instance, depending on the context of how the essay was written, spellings, punctuation, paragraphs may not matter. Or perhaps the essay has had some personal information of names and places redacted? Or perhaps some grading criteria is missing?
 4. Consider studying more successful rubric runs (by weighted kappa) in a similar manner.
 5. Use a <Scratchpad> section to combine observations about what worked and what didn't work in different rubrics.
@@ -100,10 +123,11 @@ Combine observations:
 - Identify areas for improvement based on less successful rubrics
 </Scratchpad>
 
-Provide a brief explanation of your changes, then output the updated rubric as a JSON array in a code block:
+Provide a brief explanation of your changes, then write "Updated rubric:" on its own line and output the updated rubric after it as a JSON array in a code block. Write that line only once, right before the final rubric.
 
 Example output for a rubric where the human raters are apparently grading a conversation between two old people:
 
+Updated rubric:
 ```json
 [
     "Is this a short conversation among two old people?",
@@ -119,34 +143,191 @@ Use clues from the dataset and analysis to infer what the human raters are looki
 
 """
 
+REPAIR_PROMPT_TEMPLATE = """
+The response below was meant to end with an updated essay grading rubric as a JSON array of strings in a ```json code block, but no valid one could be read from it.
 
-def improve_essay_rubric(rubric_history, rater_id, max_iterations, target_kappa):
-    dataset = load_dataset("representative", rater_id)
-    client = anthropic.Anthropic()
-    current_iteration = rubric_history[-1]["iteration"]
-    current_rubric = rubric_history[-1]["rubric"]
-    current_kappa = rubric_history[-1]["kappa"]
-
-    formatted_template = PROMPT_TEMPLATE.format(
-        dataset=dataset,
-        rubric_history=rubric_history,
-        max_iterations=max_iterations,
-        current_iteration=current_iteration,
-        current_rubric=current_rubric,
-        current_kappa=current_kappa,
-        target_kappa=target_kappa
-    )
-
-    prompt = f"{SYSTEM_PROMPT}\n\n{formatted_template}"
-
-    # Debug prints (optional)
-    # print(f"Debug - Total characters in prompt: {len(prompt)}")
-    # print("Debug - Prompt:")
-    # print(prompt)
-
-    response = client.messages.create(
-        model="claude-3-5-sonnet-20240620",
-        max_tokens=1000,
+Response:
+{response}
+
+Reply with only that rubric (or, if the response never got to it, the rubric its explanation describes) as a JSON array of strings in a ```json code block. Nothing else.
+"""
+
+
+@cache
+def get_encoding():
+    return tiktoken.get_encoding(IMPROVER_ENCODING)
+
+
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+
+def truncate_tokens(text, limit):
+    """``text`` cut to at most ``limit`` tokens, marker included."""
+    tokens = get_encoding().encode(text)
+    if len(tokens) <= limit:
+        return text
+    keep = limit - count_tokens(TRUNCATION_MARKER)
+    return get_encoding().decode(tokens[:keep]) + TRUNCATION_MARKER if keep > 0 else ""
+
+
+def summarize_history(rubric_history, token_budget):
+    """One line per iteration; over budget, the latest and best-scoring iterations are kept.
+
+    The latest line is cut short rather than dropped if it alone is over budget.
+    """
+    lines = {
+        n: f"Iteration {entry['iteration']}: kappa {entry['kappa']:.3f} {json.dumps(entry['rubric'])}"
+        for n, entry in enumerate(rubric_history)
+    }
+    latest = len(rubric_history) - 1
+    ranked = [latest] + sorted(
+        (n for n in lines if n != latest), key=lambda n: (-rubric_history[n]['kappa'], n))
+    kept, used = [], 0
+    for n in ranked:
+        tokens = count_tokens(lines[n]) + 1
+        if not kept and tokens > token_budget:
+            lines[n] = truncate_tokens(lines[n], token_budget - 1)
+            tokens = count_tokens(lines[n]) + 1 if lines[n] else 0
+        elif used + tokens > token_budget:
+            continue
+        kept.append(n)
+        used += tokens
+    return "\n".join(lines[n] for n in sorted(kept)), len(kept)
+
+
+def run_statistics(results):
+    """Confusion matrix and per-human-score bias of one run, over scores bucketed to tenths."""
+    human = np.rint(np.array([result['human_score'] for result in results]) * 10).astype(int)
+    ai = np.rint(np.array([result['ai_score'] for result in results]) * 10).astype(int)
+    delta = ai - human
+    levels, index = np.unique(np.concatenate([human, ai]), return_inverse=True)
+    k = len(levels)
+    confusion = np.bincount(index[:len(human)] * k + index[len(human):], minlength=k * k).reshape(k, k)
+    header = "human\\ai " + " ".join(f"{level / 10:>4}" for level in levels)
+    rows = [f"{level / 10:>8} " + " ".join(f"{count:>4}" for count in row) for level, row in zip(levels, confusion)]
+    bias = [
+        f"human {level / 10}: {int((human == level).sum())} essays, mean ai-human {delta[human == level].mean() / 10:+.2f}"
+        for level in np.unique(human)
+    ]
+    return "\n".join([
+        f"{len(results)} essays, mean |delta| {np.abs(delta).mean() / 10:.2f}, mean ai-human {delta.mean() / 10:+.2f}",
+        "Confusion matrix (rows: human_score, columns: ai_score):",
+        header, *rows,
+        "Bias by human_score:", *bias,
+    ])
+
+
+def disagreement_excerpts(results, essay_texts, token_budget):
+    """The largest |delta| essays of a run, with reason and a capped excerpt, until the budget runs out."""
+    blocks, used = [], 0
+    for result in sorted(results, key=lambda result: (-abs(result['delta']), result['essay_id'])):
+        block = (
+            f"[essay {result['essay_id']}] human_score {result['human_score']}, ai_score {result['ai_score']}, "
+            f"delta {result['delta']:+.2f}\n"
+            f"ai_reason: {result.get('ai_reason')}\n"
+            f"essay: {truncate_tokens(essay_texts.get(result['essay_id'], ''), ESSAY_TOKEN_LIMIT)}\n"
+        )
+        tokens = count_tokens(block)
+        if used + tokens > token_budget:
+            break
+        blocks.append(block)
+        used += tokens
+    return "\n".join(blocks), len(blocks)
+
+
+def build_improver_prompt(rubric_history, rater_id, max_iterations, target_kappa, token_budget=None):
+    """The improver prompt, kept within ``token_budget`` (IMPROVER_TOKEN_BUDGET) tokens however long the run.
+
+    Holds a one-line-per-iteration history, the last run's confusion matrix
+    and bias by human score, and as many of its largest disagreements as fit.
+    Deterministic for the same history, and returns its token count. Raises
+    ValueError if the budget doesn't even fit the template and current rubric.
+    """
+    token_budget = token_budget or config.IMPROVER_TOKEN_BUDGET
+    last = rubric_history[-1]
+    essay_texts = {item['essay_id']: item['essay_text'] for item in load_dataset("representative", rater_id)}
+    sections = {
+        "max_iterations": max_iterations,
+        "current_iteration": last["iteration"],
+        "current_rubric": last["rubric"],
+        "current_kappa": last["kappa"],
+        "target_kappa": target_kappa,
+    }
+
+    def render(rubric_history="", statistics="", essays=""):
+        formatted_template = PROMPT_TEMPLATE.format(
+            rubric_history=rubric_history, statistics=statistics, essays=essays, **sections)
+        return f"{SYSTEM_PROMPT}\n\n{formatted_template}"
+
+    free = token_budget - count_tokens(render())
+    if free < 0:
+        raise ValueError(f"Improver token budget {token_budget} is {-free} tokens short of the prompt template")
+    history, iterations = summarize_history(rubric_history, int(free * HISTORY_BUDGET_SHARE))
+    free -= count_tokens(history)
+    statistics = truncate_tokens(run_statistics(last["results"]), free)
+    free -= count_tokens(statistics)
+    essays, essay_count = disagreement_excerpts(last["results"], essay_texts, free)
+
+    prompt = render(history, statistics, essays)
+    tokens = count_tokens(prompt)
+    # Sections can tokenize a little differently inside the template; give the excess back from the excerpts
+    while tokens > token_budget and essay_count:
+        free -= tokens - token_budget
+        essays, essay_count = disagreement_excerpts(last["results"], essay_texts, free)
+        prompt = render(history, statistics, essays)
+        tokens = count_tokens(prompt)
+    print(f"Improver context: {tokens} tokens of {token_budget} "
+          f"({iterations}/{len(rubric_history)} iterations, {essay_count}/{len(last['results'])} essays)")
+    return prompt, tokens
+
+
+def parse_rubric(text, require_marker=False):
+    """The rubric in the first well-formed ```json block after the response's RUBRIC_MARKER, or None.
+
+    Blocks before the marker are examples or drafts. Unless ``require_marker``,
+    a response without it (e.g. a repair reply) falls back to its last
+    well-formed block.
+    """
+    marker = text.lower().rfind(RUBRIC_MARKER.lower())
+    if marker < 0:
+        if require_marker:
+            return None
+        rubric = None
+        for match in RUBRIC_BLOCK.finditer(text):
+            rubric = load_rubric(match.group(1)) or rubric
+        return rubric
+    for match in RUBRIC_BLOCK.finditer(text, marker + len(RUBRIC_MARKER)):
+        rubric = load_rubric(match.group(1))
+        if rubric is not None:
+            return rubric
+    return None
+
+
+def load_rubric(block):
+    """The rubric in one fenced block's body, or None if it isn't a non-empty list of steps."""
+    try:
+        rubric = json.loads(block)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(rubric, list) or not rubric or not all(isinstance(step, str) and step.strip() for step in rubric):
+        return None
+    return rubric
+
+
+async def a_stream_rubric(client, prompt, max_tokens):
+    """Stream one improver response, hanging up once a well-formed ```json rubric after RUBRIC_MARKER closes.
+
+    Without the marker the whole response is read, and ``parse_rubric``
+    takes its last well-formed block.
+
+    Returns ``(rubric or None, response text so far)``.
+    """
+    await get_rate_limiter("anthropic", IMPROVER_MODEL).a_acquire(estimate_tokens(prompt, max_tokens))
+    text = ""
+    async with client.messages.stream(
+        model=IMPROVER_MODEL,
+        max_tokens=max_tokens,
         temperature=0.7,
         messages=[
             {
@@ -154,27 +335,38 @@ def improve_essay_rubric(rubric_history, rater_id, max_iterations, target_kappa)
                 "content": prompt
             }
         ]
-    )
-
-    response_content = response.content[0].text
-
-    max_retries = 3
-    for attempt in range(max_retries):
-        json_match = re.search(r'```json\n(.*?)\n```',
-                               response_content, re.DOTALL)
-        if json_match:
-            json_content = json_match.group(1)
-            try:
-                rubric = json.loads(json_content)
-                return rubric
-            except json.JSONDecodeError:
-                print(f"Attempt {attempt + 1}: Failed to parse JSON content")
-        else:
-            print(
-                f"Attempt {attempt + 1}: No JSON content found in the response")
-
-        if attempt < max_retries - 1:
-            time.sleep(2)  # Wait for 2 seconds before retrying
-
-    print("Max retries reached. Unable to get valid JSON content.")
-    return None
+    ) as stream:
+        async for chunk in stream.text_stream:
+            text += chunk
+            # Nothing after the rubric is used, so there's no point paying for it; blocks
+            # before the marker (examples, drafts) don't end the stream
+            if "`" in chunk and parse_rubric(text, require_marker=True) is not None:
+                break
+    return parse_rubric(text), text
+
+
+async def a_improve_essay_rubric(rubric_history, rater_id, max_iterations, target_kappa, max_attempts=3):
+    """Async, streaming improver; safe to run alongside judge calls on the same event loop.
+
+    A response without a parseable rubric is followed up with a short repair
+    request that only sees that response. If no attempt yields a rubric, the
+    current rubric is returned unchanged rather than None.
+    """
+    client = anthropic.AsyncAnthropic()
+    prompt, _ = build_improver_prompt(rubric_history, rater_id, max_iterations, target_kappa)
+
+    rubric, response = await a_stream_rubric(client, prompt, 1000)
+    for attempt in range(1, max_attempts):
+        if rubric is not None:
+            return rubric
+        print(f"Attempt {attempt}: No valid JSON rubric in the response, asking for a repair")
+        rubric, response = await a_stream_rubric(client, REPAIR_PROMPT_TEMPLATE.format(response=response), 1000)
+    if rubric is not None:
+        return rubric
+
+    print("Max retries reached. Unable to get valid JSON content; keeping the current rubric.")
+    return rubric_history[-1]["rubric"]
+
+
+def improve_essay_rubric(rubric_history, rater_id, max_iterations, target_kappa):
+    return asyncio.run(a_improve_essay_rubric(rubric_history, rater_id, max_iterations, target_kappa))
@@ -1,5 +1,6 @@
 import os
 import openai
+from src.utils.rate_limiter import estimate_tokens, get_rate_limiter
 
 
 SYSTEM_PROMPT = """
@@ -33,12 +34,14 @@ def run_prompt(input_text):
         base_url="https://api.sambanova.ai/v1",
     )
 
+    prompt = PROMPT_TEMPLATE.format(input_text=input_text)
+    get_rate_limiter("sambanova", 'Meta-Llama-3.1-405B-Instruct').acquire(
+        estimate_tokens(SYSTEM_PROMPT + prompt))
     response = client.chat.completions.create(
         model='Meta-Llama-3.1-405B-Instruct',
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": PROMPT_TEMPLATE.format(
-                input_text=input_text)}
+            {"role": "user", "content": prompt}
         ],
         temperature=0.7,
         top_p=0.1
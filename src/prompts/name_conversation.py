@@ -1,5 +1,6 @@
 import os
 import openai
+from src.utils.rate_limiter import estimate_tokens, get_rate_limiter
 
 
 SYSTEM_PROMPT = """
@@ -38,13 +39,15 @@ def run_prompt(conversation_text):
         base_url="https://api.sambanova.ai/v1",
     )
 
-    print(PROMPT_TEMPLATE.format(conversation_text=conversation_text))
+    prompt = PROMPT_TEMPLATE.format(conversation_text=conversation_text)
+    print(prompt)
+    get_rate_limiter("sambanova", 'Meta-Llama-3.1-405B-Instruct').acquire(
+        estimate_tokens(SYSTEM_PROMPT + prompt))
     response = client.chat.completions.create(
         model='Meta-Llama-3.1-405B-Instruct',
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": PROMPT_TEMPLATE.format(
-                conversation_text=conversation_text)}
+            {"role": "user", "content": prompt}
         ],
         temperature=0.7,
         top_p=0.1
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+import openai
+
+log = logging.getLogger(__name__)
+
+RETRY_AFTER_HEADERS = ("retry-after-ms", "retry-after",
+                       "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class MaxRetriesExceeded(Exception):
+    """Raised once a call has been retried as many times as allowed and still failed."""
+
+
+def parse_duration(value: str) -> float | None:
+    """Seconds in a rate-limit header: "2", "250ms", "1m30s" or an HTTP date."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if parts:
+        return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error: Exception) -> float | None:
+    """How long the provider asked us to back off, if the error says."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header in RETRY_AFTER_HEADERS:
+        value = response.headers.get(header)
+        if value is None:
+            continue
+        seconds = parse_duration(value)
+        if seconds is not None:
+            return seconds / 1000 if header == "retry-after-ms" else seconds
+    return None
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight judge calls, driven by provider feedback.
+
+    Every success grows the limit by ~1 per window of ``limit`` calls; a 429,
+    timeout, 5xx or dropped connection halves it (at most once per ``cooldown``) and pauses new calls for
+    as long as the provider's Retry-After/rate-limit headers ask. The limit
+    therefore tracks whatever throughput the provider can sustain right now.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        decrease_factor: float = 0.5,
+        cooldown: float = 1.0,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+    ):
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.in_flight = 0
+        self.waiting = 0
+        self.successes = 0
+        self.throttle_events = 0
+        self.timeouts = 0
+        self.server_errors = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def call(self, func, *args, **kwargs):
+        """Run ``await func(*args, **kwargs)`` in a slot, retrying on 429s, timeouts and server errors."""
+        for attempt in range(self.max_retries + 1):
+            async with self._slot():
+                try:
+                    result = await func(*args, **kwargs)
+                except openai.RateLimitError as e:
+                    self.throttle_events += 1
+                    self._throttle(retry_after(e), attempt)
+                    continue
+                except (openai.APITimeoutError, TimeoutError):
+                    self.timeouts += 1
+                    self._throttle(None, attempt)
+                    continue
+                except (openai.APIConnectionError, openai.InternalServerError) as e:
+                    # Whatever retries the client made already failed; back off before the next
+                    self.server_errors += 1
+                    self._throttle(retry_after(e), attempt)
+                    continue
+                self._succeed()
+                return result
+        raise MaxRetriesExceeded(f"Gave up after {self.max_retries + 1} attempts")
+
+    @asynccontextmanager
+    async def _slot(self):
+        self.waiting += 1
+        try:
+            async with self._condition:
+                while True:
+                    pause = self._paused_until - time.monotonic()
+                    if pause > 0:
+                        try:
+                            await asyncio.wait_for(self._condition.wait(), pause)
+                        except TimeoutError:
+                            pass
+                        continue
+                    if self.in_flight < int(self.limit):
+                        break
+                    await self._condition.wait()
+                self.in_flight += 1
+        finally:
+            # A caller cancelled while queued (e.g. a losing hedge) is no longer waiting either
+            self.waiting -= 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def _succeed(self):
+        self.successes += 1
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _throttle(self, delay: float | None, attempt: int):
+        now = time.monotonic()
+        # Calls that were already in flight when capacity dropped would each
+        # halve the limit again; one decrease per congestion event is enough
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+            self._last_decrease = now
+        if delay is None:
+            delay = (2 ** attempt) * self.base_delay + random.uniform(0, 1)
+        self._paused_until = max(self._paused_until, now + delay)
+        log.info(f"Throttled: concurrency limit now {int(self.limit)}, pausing {delay:.1f}s")
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "successes": self.successes,
+            "throttle_events": self.throttle_events,
+            "timeouts": self.timeouts,
+            "server_errors": self.server_errors,
+        }
@@ -0,0 +1,61 @@
+import math
+import random
+
+import numpy as np
+
+from src.utils.kappa import KappaAccumulator
+
+
+class EssaySelector:
+    """Chooses which essays a rubric optimizer iteration sends to the judge.
+
+    Every rubric's results feed a per-essay record of its |delta| to the human
+    score and of how much its AI score moves between rubrics. Essays whose
+    mean |delta| plus score spread over the last ``window`` rubrics that
+    judged them is above ``tolerance`` (and any not judged yet) are always
+    selected; of the settled rest only a random ``audit_fraction`` is,
+    weighted by the inverse of that fraction. The weighted confusion matrix
+    is then unbiased for the full set's, and ``estimate_kappa``, a ratio of
+    its sums, a consistent (not unbiased) estimate of the full-set kappa.
+    As rubrics settle more essays, iterations judge fewer of them.
+    """
+
+    def __init__(self, essay_ids: list[str], tolerance: float = 0.1, audit_fraction: float = 0.2,
+                 window: int = 3, seed: int = 0):
+        self.essay_ids = list(essay_ids)
+        self.tolerance = tolerance
+        self.window = window
+        self.audit_fraction = audit_fraction
+        self.scores = {essay_id: [] for essay_id in self.essay_ids}
+        self.deltas = {essay_id: [] for essay_id in self.essay_ids}
+        self._rng = random.Random(seed)
+
+    def update(self, results: list[dict]):
+        for result in results:
+            self.scores[result['essay_id']].append(result['ai_score'])
+            self.deltas[result['essay_id']].append(abs(result['delta']))
+
+    def priority(self, essay_id: str) -> float:
+        """Recent mean |delta| plus the spread of AI scores across rubrics; inf if never judged."""
+        if not self.scores[essay_id]:
+            return math.inf
+        # An essay early rubrics got wrong settles once recent ones get it right
+        return float(np.mean(self.deltas[essay_id][-self.window:]) + np.std(self.scores[essay_id][-self.window:]))
+
+    def select(self) -> dict[str, float]:
+        """{essay_id: weight} for the next iteration; weights are 1 / probability of selection."""
+        focus = [essay_id for essay_id in self.essay_ids if self.priority(essay_id) > self.tolerance]
+        settled = [essay_id for essay_id in self.essay_ids if self.priority(essay_id) <= self.tolerance]
+        selection = dict.fromkeys(focus, 1.0)
+        if settled:
+            audit = self._rng.sample(settled, max(1, math.ceil(self.audit_fraction * len(settled))))
+            selection.update(dict.fromkeys(audit, len(settled) / len(audit)))
+        return selection
+
+    @staticmethod
+    def estimate_kappa(results: list[dict], weights: dict[str, float]) -> float:
+        """Full-set kappa estimated from a weighted selection's results (a ratio estimator, so slightly biased on small selections)."""
+        accumulator = KappaAccumulator()
+        for result in results:
+            accumulator.add(result['human_score'], result['ai_score'], weights[result['essay_id']])
+        return accumulator.kappa()
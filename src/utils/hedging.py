@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyTracker:
+    """Rolling window of call latencies with percentile lookups."""
+
+    def __init__(self, window: int = 500):
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def __len__(self):
+        return len(self._latencies)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if not self._latencies:
+                return None
+            return float(np.percentile(self._latencies, q * 100))
+
+    def summary(self) -> dict:
+        with self._lock:
+            if not self._latencies:
+                return {"count": 0}
+            p50, p95, p99 = np.percentile(self._latencies, [50, 95, 99])
+            return {"count": len(self._latencies), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+async def hedged_call(make_call, timeout: float | None = None, hedge_after: float | None = None):
+    """Await ``make_call()`` under a deadline, hedging slow calls with a duplicate.
+
+    After ``hedge_after`` seconds without an answer a second identical call is
+    started; the first one to return without raising wins and the other is
+    cancelled. Raises ``TimeoutError`` once ``timeout`` has elapsed.
+    """
+    start = time.monotonic()
+    tasks = [asyncio.ensure_future(make_call())]
+    hedged = hedge_after is None
+    error = None
+    try:
+        while tasks:
+            elapsed = time.monotonic() - start
+            waits = []
+            if timeout is not None:
+                waits.append(timeout - elapsed)
+            if not hedged:
+                waits.append(hedge_after - elapsed)
+            done, _ = await asyncio.wait(
+                tasks, timeout=max(0, min(waits)) if waits else None,
+                return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                tasks.remove(task)
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+
+            elapsed = time.monotonic() - start
+            if timeout is not None and elapsed >= timeout:
+                raise TimeoutError(
+                    f"Judge call exceeded its {timeout}s deadline")
+            if not hedged and elapsed >= hedge_after and tasks:
+                tasks.append(asyncio.ensure_future(make_call()))
+                hedged = True
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from src.config import config
+
+
+class JudgeCacheMiss(KeyError):
+    """Raised in replay mode when a prompt has never been answered before."""
+
+
+class JudgeCache:
+    """Content-addressed, on-disk store of judge responses.
+
+    Entries are keyed by a hash of (model name, rendered prompt, sampling params)
+    and evicted least-recently-used first once ``max_entries`` or ``max_bytes``
+    is exceeded. In ``replay`` mode the database is opened read-only (a missing
+    one counts as empty) and a miss raises ``JudgeCacheMiss`` instead of
+    falling through to the network.
+    """
+
+    def __init__(self, path, max_entries: int | None = 100_000, max_bytes: int | None = None, replay: bool = False):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if replay:
+            # Nothing recorded yet is an empty cache: every lookup misses
+            self._conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False) if self.path.exists() else None
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, prompt: str, params: dict | None = None) -> str:
+        payload = json.dumps([model_name, prompt, params or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = None if self._conn is None else self._conn.execute(
+                "SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise JudgeCacheMiss(key)
+                return None
+
+            self.hits += 1
+            if not self.replay:
+                self._conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        if self.replay:
+            return
+
+        data = json.dumps(value)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        count, size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if self.max_entries is not None and count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Walk from the oldest entry until enough bytes have been freed
+            excess = size - self.max_bytes
+            stale = []
+            for key, entry_size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                if excess <= 0:
+                    break
+                stale.append((key,))
+                excess -= entry_size
+            self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self) -> dict:
+        if self._conn is None:
+            return {"hits": self.hits, "misses": self.misses, "entries": 0, "bytes": 0}
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+_judge_cache = None
+
+
+def get_judge_cache() -> JudgeCache | None:
+    """Process-wide cache configured from JUDGE_CACHE_* env vars, or None when disabled."""
+    global _judge_cache
+    if config.JUDGE_CACHE_MODE == "off":
+        return None
+    if _judge_cache is None:
+        _judge_cache = JudgeCache(
+            config.JUDGE_CACHE_PATH,
+            max_entries=config.JUDGE_CACHE_MAX_ENTRIES,
+            replay=config.JUDGE_CACHE_MODE == "replay",
+        )
+    return _judge_cache
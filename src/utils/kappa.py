@@ -0,0 +1,119 @@
+import threading
+
+import numpy as np
+
+
+class KappaAccumulator:
+    """Quadratic weighted kappa over a running human × AI confusion matrix.
+
+    Scores in [0, 1] are bucketed like ``compute_weighted_kappa`` (×``scale``,
+    rounded), so ``kappa()`` matches it on the same essays. ``interval()`` is
+    a bootstrap over the confusion matrix: each resample is a multinomial
+    draw of the cells, and all resamples are scored at once with NumPy.
+    Essays can carry a weight (e.g. one over their chance of being sampled),
+    which scales their cell counts but not the bootstrap's sample size.
+    """
+
+    def __init__(self, scale: int = 10, resamples: int = 1000, seed: int = 0):
+        self.scale = scale
+        self.resamples = resamples
+        self.counts = np.zeros((scale + 1, scale + 1))
+        self.essays = 0
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def n(self) -> int:
+        return self.essays
+
+    def _bucket(self, score: float) -> int:
+        return int(np.clip(np.rint(score * self.scale), 0, self.scale))
+
+    def add(self, human_score: float, ai_score: float, weight: float = 1.0):
+        with self._lock:
+            self.counts[self._bucket(human_score), self._bucket(ai_score)] += weight
+            self.essays += 1
+
+    def add_many(self, human_scores, ai_scores, weights=None):
+        for i, (human_score, ai_score) in enumerate(zip(human_scores, ai_scores)):
+            self.add(human_score, ai_score, 1.0 if weights is None else weights[i])
+
+    def _observed(self) -> np.ndarray:
+        # Like sklearn, only buckets that occur count, and weights go by their rank
+        with self._lock:
+            counts = self.counts.copy()
+        labels = (counts.sum(axis=0) + counts.sum(axis=1)) > 0
+        return counts[np.ix_(labels, labels)]
+
+    @staticmethod
+    def _kappas(observed: np.ndarray) -> np.ndarray:
+        """Kappa of each confusion matrix in a (..., k, k) stack."""
+        k = observed.shape[-1]
+        ranks = np.arange(k)
+        weights = (ranks[:, None] - ranks[None, :]) ** 2
+        n = observed.sum(axis=(-2, -1))[..., None, None]
+        expected = observed.sum(axis=-1)[..., :, None] * observed.sum(axis=-2)[..., None, :] / n
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return 1 - (weights * observed).sum(axis=(-2, -1)) / (weights * expected).sum(axis=(-2, -1))
+
+    def kappa(self) -> float:
+        observed = self._observed()
+        if observed.shape[0] < 2:
+            return float("nan")
+        return float(self._kappas(observed))
+
+    def _bootstrap(self) -> np.ndarray | None:
+        observed = self._observed()
+        n = self.essays
+        if observed.shape[0] < 2 or n < 2:
+            return None
+        samples = self._rng.multinomial(n, (observed / observed.sum()).ravel(), size=self.resamples)
+        kappas = self._kappas(samples.reshape(self.resamples, *observed.shape).astype(float))
+        if np.isnan(kappas).all():
+            return None
+        return kappas
+
+    @staticmethod
+    def _percentiles(kappas: np.ndarray | None, confidence: float) -> tuple[float, float]:
+        if kappas is None:
+            return -1.0, 1.0
+        tail = (1 - confidence) / 2 * 100
+        lower, upper = np.nanpercentile(kappas, [tail, 100 - tail])
+        return float(lower), float(upper)
+
+    def interval(self, confidence: float = 0.95) -> tuple[float, float]:
+        """Bootstrap CI of the kappa; (-1, 1) while there's too little to go on.
+
+        Valid for one look at the data only: after a sequential stop it is
+        narrower than the true uncertainty.
+        """
+        return self._percentiles(self._bootstrap(), confidence)
+
+    def decision(self, ci_width: float | None = None, threshold: float | None = None,
+                 confidence: float = 0.95, min_essays: int = 20, looks: int = 1) -> str | None:
+        """Why scoring more essays can stop: "ci_width", "above" or "below" the threshold, or None to go on.
+
+        The threshold test is repeated at each of up to ``looks`` planned checks,
+        so it uses a Bonferroni-corrected interval (confidence
+        ``1 - (1 - confidence) / looks``) to keep the chance of any wrong
+        above/below call within ``1 - confidence``. The width stop makes no
+        claim about the threshold and uses the nominal interval.
+        """
+        if self.n < min_essays or (ci_width is None and threshold is None):
+            return None
+        kappas = self._bootstrap()
+        if threshold is not None:
+            lower, upper = self._percentiles(kappas, 1 - (1 - confidence) / max(looks, 1))
+            if lower > threshold:
+                return "above"
+            if upper < threshold:
+                return "below"
+        if ci_width is not None:
+            lower, upper = self._percentiles(kappas, confidence)
+            if upper - lower <= ci_width:
+                return "ci_width"
+        return None
+
+    def summary(self, confidence: float = 0.95) -> dict:
+        lower, upper = self.interval(confidence)
+        return {"essays": self.n, "kappa": self.kappa(), "ci": [lower, upper], "confidence": confidence}
@@ -0,0 +1,108 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+
+from src.config import config
+
+
+class PreScorer:
+    """Local stand-in for the LLM judge, trained on the judge's own past verdicts.
+
+    Every verdict the judge hands down is stored as (rubric id, essay text,
+    choice). Once ``min_examples`` verdicts exist, hashed TF-IDF features with
+    the rubric id as an extra token feed a logistic regression over the A-H
+    choices, which then pre-scores essays on CPU. The model is refit whenever
+    ``retrain_every`` new verdicts have come in.
+    """
+
+    def __init__(self, path, min_examples: int = 100, retrain_every: int = 200):
+        self.path = Path(path)
+        self.min_examples = min_examples
+        self.retrain_every = retrain_every
+        self.model = None
+        self.trained_on = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                rubric_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                text TEXT NOT NULL,
+                choice TEXT NOT NULL,
+                PRIMARY KEY (rubric_id, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def rubric_id(rubric: list[str]) -> str:
+        return hashlib.sha256("\n".join(step.strip() for step in rubric).encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def _document(rubric_id: str, text: str) -> str:
+        # The rubric rides along as one more token, so verdicts under every rubric train one model
+        return f"{text} rubric_{rubric_id}"
+
+    def add(self, rubric_id: str, verdicts: list[tuple[str, str]]):
+        """Store (essay text, judge choice) pairs; a re-judged essay keeps its latest choice."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (rubric_id, text_hash, text, choice) VALUES (?, ?, ?, ?)",
+                [(rubric_id, hashlib.sha256(text.encode("utf-8")).hexdigest(), text, choice)
+                 for text, choice in verdicts],
+            )
+            self._conn.commit()
+            self._pending += len(verdicts)
+
+    def maybe_retrain(self) -> bool:
+        if self.model is None or self._pending >= self.retrain_every:
+            return self.fit()
+        return False
+
+    def fit(self) -> bool:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rubric_id, text, choice FROM verdicts").fetchall()
+        choices = [choice for _, _, choice in rows]
+        if len(rows) < self.min_examples or len(set(choices)) < 2:
+            return False
+
+        model = make_pipeline(
+            HashingVectorizer(ngram_range=(1, 2), n_features=2 ** 18, alternate_sign=False, norm=None),
+            TfidfTransformer(sublinear_tf=True),
+            LogisticRegression(max_iter=1000),
+        )
+        model.fit([self._document(rubric_id, text) for rubric_id, text, _ in rows], choices)
+        self.model = model
+        self.trained_on = len(rows)
+        self._pending = 0
+        return True
+
+    def predict(self, rubric_id: str, texts: list[str]) -> list[dict[str, float]] | None:
+        """A {choice: probability} distribution per text, or None until there's enough to train on."""
+        if self.model is None and not self.fit():
+            return None
+        probs = self.model.predict_proba([self._document(rubric_id, text) for text in texts])
+        return [
+            {choice: float(prob) for choice, prob in zip(self.model.classes_, row)}
+            for row in probs
+        ]
+
+
+_pre_scorer = None
+
+
+def get_pre_scorer() -> PreScorer:
+    """Process-wide pre-scorer stored at PRE_SCORER_PATH."""
+    global _pre_scorer
+    if _pre_scorer is None:
+        _pre_scorer = PreScorer(config.PRE_SCORER_PATH)
+    return _pre_scorer
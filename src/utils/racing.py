@@ -0,0 +1,65 @@
+import asyncio
+import math
+import random
+
+from src.utils.kappa import KappaAccumulator
+
+
+def stratified_order(dataset, seed: int = 0) -> list[str]:
+    """Essay ids ordered so that every prefix covers the human scores about evenly."""
+    rng = random.Random(seed)
+    strata = {}
+    for item in dataset:
+        strata.setdefault(item['score'], []).append(item['essay_id'])
+    for essay_ids in strata.values():
+        rng.shuffle(essay_ids)
+    # Round-robin over the score levels, then whatever the largest levels have left
+    order = []
+    for rank in range(max(map(len, strata.values()), default=0)):
+        order.extend(essay_ids[rank] for _, essay_ids in sorted(strata.items()) if rank < len(essay_ids))
+    return order
+
+
+async def a_race_rubrics(rubrics, evaluate, essay_ids: list[str], min_essays: int = 12, eta: int = 2,
+                         bar: float | None = None, confidence: float = 0.9) -> list[dict]:
+    """Successive halving: score every rubric on a prefix of ``essay_ids``, keep the best, double the prefix.
+
+    ``evaluate(rubric, essay_ids)`` returns ``(results, kappa)`` like
+    ``run_essay_eval``; with a score store it only judges the essays it
+    hasn't seen, so each rung costs just the new essays. After each rung the
+    rubrics are ranked by the upper bound of their kappa interval and only
+    the top ``1/eta`` survive; with a ``bar`` (e.g. the weakest kappa still
+    in the beam) a rubric whose upper bound is below it drops out too.
+
+    Returns one outcome per rubric: its results and kappa on the essays it
+    got through, how many essays that was, and whether it reached the full set.
+    """
+    total = len(essay_ids)
+    outcomes = [None] * len(rubrics)
+    alive = list(range(len(rubrics)))
+    n = min(min_essays, total)
+    judge_calls = 0
+    while alive:
+        runs = await asyncio.gather(*(evaluate(rubrics[i], essay_ids[:n]) for i in alive))
+        for i, (results, kappa) in zip(alive, runs):
+            judge_calls += sum(result['ai_source'] == 'judge' for result in results)
+            outcomes[i] = {"rubric": rubrics[i], "results": results, "kappa": kappa, "essays": n, "complete": n == total}
+        if n == total:
+            break
+
+        upper = {}
+        for i in alive:
+            accumulator = KappaAccumulator()
+            accumulator.add_many(
+                [result['human_score'] for result in outcomes[i]["results"]],
+                [result['ai_score'] for result in outcomes[i]["results"]])
+            upper[i] = accumulator.interval(confidence)[1]
+        alive = sorted(alive, key=upper.get, reverse=True)[:max(1, math.ceil(len(alive) / eta))]
+        if bar is not None:
+            alive = [i for i in alive if upper[i] >= bar]
+        # A lone survivor has nothing left to race but the bar
+        n = total if len(alive) == 1 and bar is None else min(2 * n, total)
+
+    print(f"Racing: {judge_calls} judge calls for {len(rubrics)} rubrics "
+          f"(vs {total * len(rubrics)} scoring each on all {total} essays)")
+    return outcomes
@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import fcntl
+import json
+import re
+import threading
+import time
+from pathlib import Path
+
+from src.config import config
+
+# Judge replies are short JSON objects; used when a call doesn't cap max_tokens
+DEFAULT_OUTPUT_TOKENS = 200
+
+
+# Seconds the current thread or task has spent in acquire(); code timing a
+# request whose model paces itself subtracts this to get the provider's latency
+limiter_wait: contextvars.ContextVar[float] = contextvars.ContextVar("limiter_wait", default=0.0)
+
+
+def estimate_tokens(prompt: str, max_tokens: int | None = None, n: int = 1) -> int:
+    # ~4 characters per token is close enough for budgeting and avoids a tokenizer per call;
+    # the prompt is billed once, but each of the n completions can use max_tokens
+    return len(prompt) // 4 + (max_tokens or DEFAULT_OUTPUT_TOKENS) * n
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute token buckets for one provider/model.
+
+    Callers reserve capacity *before* sending a request, so a run paces itself
+    at the provider ceiling instead of bouncing off 429s. With ``state_path``
+    the bucket levels live in a file guarded by ``flock``, so every process
+    pointing at the same file shares one budget.
+    """
+
+    def __init__(self, name: str, rpm: float | None = None, tpm: float | None = None, state_path=None):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = Path(state_path) if state_path else None
+        self.throttled = 0
+        self._lock = threading.Lock()
+        self._state = {"requests": rpm or 0, "tokens": tpm or 0, "updated": time.monotonic()}
+        if self.state_path is not None:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            self.state_path.touch(exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rpm is not None or self.tpm is not None
+
+    def acquire(self, tokens: int = 0):
+        start = time.perf_counter()
+        while (wait := self._reserve(tokens)) > 0:
+            time.sleep(wait)
+        limiter_wait.set(limiter_wait.get() + time.perf_counter() - start)
+
+    async def a_acquire(self, tokens: int = 0):
+        start = time.perf_counter()
+        while (wait := await self._a_reserve(tokens)) > 0:
+            await asyncio.sleep(wait)
+        limiter_wait.set(limiter_wait.get() + time.perf_counter() - start)
+
+    async def _a_reserve(self, tokens: int) -> float:
+        if self.state_path is None or not self.enabled:
+            return self._reserve(tokens)
+        # flock blocks while another process holds the file, which would stall the whole event loop
+        return await asyncio.to_thread(self._reserve, tokens)
+
+    def _reserve(self, tokens: int) -> float:
+        """Take one request and ``tokens`` from the buckets, or return how long to wait."""
+        if not self.enabled:
+            return 0
+
+        with self._lock:
+            if self.state_path is None:
+                wait, self._state = self._take(self._state, tokens, time.monotonic())
+                return wait
+
+            with open(self.state_path, "r+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    state = json.loads(f.read() or "null") or {
+                        "requests": self.rpm or 0, "tokens": self.tpm or 0, "updated": time.time()}
+                    # Wall-clock time, since monotonic clocks aren't comparable across processes
+                    wait, state = self._take(state, tokens, time.time())
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    # Flush while still holding the lock, or another process can read a half-written file
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                return wait
+
+    def _take(self, state: dict, tokens: int, now: float) -> tuple[float, dict]:
+        elapsed = max(0, now - state["updated"])
+        requests = state["requests"]
+        token_level = state["tokens"]
+        waits = []
+        if self.rpm is not None:
+            requests = min(self.rpm, requests + elapsed * self.rpm / 60)
+            if requests < 1:
+                waits.append((1 - requests) * 60 / self.rpm)
+        if self.tpm is not None:
+            # A request larger than the whole bucket would otherwise wait forever
+            tokens = min(tokens, self.tpm)
+            token_level = min(self.tpm, token_level + elapsed * self.tpm / 60)
+            if token_level < tokens:
+                waits.append((tokens - token_level) * 60 / self.tpm)
+
+        if waits:
+            self.throttled += 1
+            return max(waits), {"requests": requests, "tokens": token_level, "updated": now}
+        return 0, {
+            "requests": requests - 1 if self.rpm is not None else requests,
+            "tokens": token_level - tokens if self.tpm is not None else token_level,
+            "updated": now,
+        }
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    """Process-wide limiter for ``provider/model``, configured from RATE_LIMITS.
+
+    RATE_LIMITS is JSON mapping "provider/model" (or "provider/*") to
+    {"rpm": ..., "tpm": ...}; unconfigured models get a limiter that never waits.
+    Set RATE_LIMIT_STATE_DIR to share budgets across processes.
+    """
+    name = f"{provider}/{model}"
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            limits = config.RATE_LIMITS.get(
+                name) or config.RATE_LIMITS.get(f"{provider}/*") or {}
+            state_path = None
+            if config.RATE_LIMIT_STATE_DIR:
+                state_path = Path(config.RATE_LIMIT_STATE_DIR) / \
+                    f"{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.json"
+            _rate_limiters[name] = RateLimiter(
+                name, rpm=limits.get("rpm"), tpm=limits.get("tpm"), state_path=state_path)
+        return _rate_limiters[name]
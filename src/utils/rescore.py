@@ -0,0 +1,135 @@
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
+
+CHOICES = ComparisonGEvalTemplate.CHOICES
+CHOICE_INDEX = {choice: i for i, choice in enumerate(CHOICES)}
+
+
+def mapping_vector(mapping: dict[str, float] | None = None) -> np.ndarray:
+    """The A-H score table as an array; letters missing from ``mapping`` keep their current score.
+
+    Built from a copy, so re-tuning never touches the live CHOICE_SCORES.
+    """
+    scores = {**ComparisonGEvalTemplate.CHOICE_SCORES, **(mapping or {})}
+    return np.array([scores[choice] for choice in CHOICES], dtype=float)
+
+
+def infer_choices(ai_scores: np.ndarray) -> list[tuple[str, ...]]:
+    """Candidate choices for results saved before the raw choice was kept.
+
+    The current table maps C/E to 1 and D/G to 0, so those scores leave two
+    candidates; every other score pins down its letter.
+    """
+    by_score = {}
+    for choice, score in ComparisonGEvalTemplate.CHOICE_SCORES.items():
+        by_score.setdefault(float(score), []).append(choice)
+    return [tuple(by_score.get(float(score), ())) for score in ai_scores]
+
+
+def rescore(results: list[dict], mapping: dict[str, float] | None = None, score_mode: str = "choice") -> tuple[np.ndarray, np.ndarray]:
+    """Re-map stored judge choices to scores without calling the judge.
+
+    Returns ``(scores, known)``: ``known`` is False for legacy results whose
+    choice can't be recovered under ``mapping`` (e.g. a stored 1 when C and E
+    now score differently); their score is NaN. With ``score_mode="logprobs"``
+    results that kept the judge's choice distribution get its expected score
+    instead; pre-scorer results keep their choice, since their distribution
+    is the local model's, not the judge's.
+    """
+    table = mapping_vector(mapping)
+    n = len(results)
+    index = np.full(n, -1)
+    for i, result in enumerate(results):
+        index[i] = CHOICE_INDEX.get(result.get("ai_choice") or "", -1)
+    scores = np.where(index >= 0, table[np.maximum(index, 0)], np.nan)
+
+    legacy = np.flatnonzero(index < 0)
+    if legacy.size:
+        ai_scores = np.array([results[i]["ai_score"] for i in legacy], dtype=float)
+        for i, candidates in zip(legacy, infer_choices(ai_scores)):
+            candidate_scores = {table[CHOICE_INDEX[choice]] for choice in candidates}
+            if len(candidate_scores) == 1:
+                scores[i] = candidate_scores.pop()
+
+    if score_mode == "logprobs":
+        rows = [i for i, result in enumerate(results)
+                if result.get("ai_choice_probs") and result.get("ai_source") != "local"]
+        if rows:
+            probs = np.zeros((len(rows), len(CHOICES)))
+            for row, i in enumerate(rows):
+                for choice, prob in results[i]["ai_choice_probs"].items():
+                    if choice in CHOICE_INDEX:
+                        probs[row, CHOICE_INDEX[choice]] = prob
+            scores[rows] = probs @ table
+    return scores, ~np.isnan(scores)
+
+
+def weighted_kappa(human_scores, ai_scores, scale: float = 10) -> float:
+    """Quadratic weighted kappa, matching ``compute_weighted_kappa`` but with a tunable bucket scale."""
+    human = np.rint(np.asarray(human_scores, dtype=float) * scale).astype(int)
+    ai = np.rint(np.asarray(ai_scores, dtype=float) * scale).astype(int)
+    # Like sklearn, weights are over the rank of each observed bucket, not its value
+    labels, index = np.unique(np.concatenate([human, ai]), return_inverse=True)
+    k = len(labels)
+    if k < 2:
+        return float("nan")
+    observed = np.bincount(index[:len(human)] * k + index[len(human):], minlength=k * k).reshape(k, k)
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / observed.sum()
+    ranks = np.arange(k)
+    weights = (ranks[:, None] - ranks[None, :]) ** 2
+    return float(1 - (weights * observed).sum() / (weights * expected).sum())
+
+
+def rescore_run(results: list[dict], mapping: dict[str, float] | None = None, score_mode: str = "choice", scale: float = 10) -> dict:
+    """Re-mapped scores and kappa for one run's results (as returned by ``run_essay_eval``)."""
+    scores, known = rescore(results, mapping, score_mode)
+    human = np.array([result["human_score"] for result in results], dtype=float)
+    return {
+        "scores": scores.tolist(),
+        "kappa": weighted_kappa(human[known], scores[known], scale) if known.any() else float("nan"),
+        "essays": len(results),
+        "unrecoverable": int((~known).sum()),
+    }
+
+
+def rescore_backup(path, mapping: dict[str, float] | None = None, score_mode: str = "choice", scale: float = 10) -> dict:
+    """Kappa per iteration and for the final evaluation of a ``backups/*.json`` optimization run."""
+    with open(path) as f:
+        backup = json.load(f)
+    iterations = [
+        {
+            "iteration": entry["iteration"],
+            "stored_kappa": entry["kappa"],
+            **{k: v for k, v in rescore_run(entry["results"], mapping, score_mode, scale).items() if k != "scores"},
+        }
+        for entry in backup.get("rubric_history", [])
+    ]
+    final = None
+    if backup.get("final_results"):
+        final = {
+            "stored_kappa": backup["final_kappa"],
+            **{k: v for k, v in rescore_run(backup["final_results"], mapping, score_mode, scale).items() if k != "scores"},
+        }
+    return {"path": str(path), "iterations": iterations, "final": final}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score saved essay evaluations with a new choice→score table")
+    parser.add_argument('paths', nargs='*', help='Optimization backups (default: backups/*.json)')
+    parser.add_argument('--mapping', type=str, default='{}',
+                        help='JSON {choice: score} overrides, e.g. \'{"E": 0.9, "G": 0.1}\'')
+    parser.add_argument('--score-mode', choices=['choice', 'logprobs'], default='choice')
+    parser.add_argument('--scale', type=float, default=10,
+                        help='Scores are multiplied by this and rounded into kappa buckets')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(Path("backups").glob("*.json"))
+    mapping = json.loads(args.mapping)
+    print(json.dumps([
+        rescore_backup(path, mapping, args.score_mode, args.scale) for path in paths
+    ], indent=2))
@@ -1,25 +1,96 @@
 import argparse
+import asyncio
 import json
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 import random
 import csv
-from src.metrics.comparison_g_eval.comparison_g_eval_metric import ComparisonGEval
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.metrics.comparison_g_eval.comparison_g_eval_metric import ComparisonGEval, JudgeVerdict
+from src.metrics.comparison_g_eval.schema import ComparisonGEvalResult
 from src.config import config
-from src.utils.safe_measure import safe_measure
+from src.utils.adaptive_concurrency import AdaptiveConcurrency
+from src.utils.hedging import LatencyTracker
+from src.utils.kappa import KappaAccumulator
+from src.utils.pre_scorer import PreScorer, get_pre_scorer
+from src.utils.safe_measure import a_safe_measure_batch, a_safe_measure_result
+from src.utils.score_store import ScoreStore, get_score_store
+from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
 from deepeval.test_case import LLMTestCase, LLMTestCaseParams
 from sklearn.metrics import cohen_kappa_score
 import numpy as np
 
+# How many new scores between sequential kappa checks; each check is a bootstrap
+KAPPA_CHECK_EVERY = 10
+
 
 class EssayEvalConfig(BaseModel):
     rubric: List[str]
     rater_id: int
     dataset: str
     num_examples: Optional[int] = None
+    # Only these essays of the dataset, in this order (used to race rubrics on subsets)
+    essay_ids: list[str] | None = None
+    concurrency: int | None = None
+    max_concurrency: int | None = None
+    # "logprobs" scores by the expected value over the judge's A-H distribution
+    score_mode: str = "choice"
+    # Without reasons the judge only emits a choice letter; reasons are then
+    # fetched only for essays far from the human score or judged with low confidence
+    include_reason: bool = True
+    reason_delta_threshold: float = 0.4
+    reason_confidence_threshold: float = 0.5
+    # Per-call judge deadline in seconds, and the latency quantile after which
+    # a slow call is hedged with a duplicate request
+    timeout: float | None = None
+    hedge_quantile: float | None = None
+    # Essays judged per LLM call; the rubric and instructions are sent once per batch
+    batch_size: int = 1
+    # Self-consistency: up to this many judge samples per essay, stopping once the
+    # majority score is settled; the agreement becomes the essay's confidence
+    samples: int = 1
+    # Cascade: a cheaper judge (defaults to JUDGE_CASCADE_MODEL) scores first and
+    # essays it is less confident about than escalation_threshold go to the main judge
+    cascade_model: str | None = None
+    escalation_threshold: float = 0.8
+    # Stream judge responses and score as soon as the choice arrives; flagged
+    # essays then get their reason from the rest of the stream unless
+    # stream_reasons is off, which cancels each stream after the choice
+    stream: bool = False
+    stream_reasons: bool = True
+    # Local pre-scorer trained on past judge verdicts: essays it is at least
+    # pre_scorer_threshold confident about skip the judge, except for a random
+    # pre_scorer_audit share that is judged anyway to measure agreement
+    pre_scorer: bool = False
+    pre_scorer_threshold: float = 0.9
+    pre_scorer_audit: float = 0.1
+    # Reuse verdicts already stored for this rubric, essay, judge model and
+    # template version instead of calling the judge, and store new ones
+    score_store: bool = False
+    # Sequential kappa: essays are judged in random order and judging stops once the
+    # kappa confidence interval is narrower than kappa_ci_width, or lies wholly above
+    # or below kappa_threshold (an interval widened for being checked every
+    # KAPPA_CHECK_EVERY essays); the essays not judged by then are left out of the run
+    kappa_ci_width: float | None = None
+    kappa_threshold: float | None = None
+    kappa_confidence: float = 0.95
+    kappa_min_essays: int = 20
+
+    @model_validator(mode="after")
+    def check_batching(self):
+        # A batch is one plain judge call: it can't escalate, vote, or be timed out per essay
+        if self.batch_size > 1:
+            if self.cascade_model or config.JUDGE_CASCADE_MODEL:
+                raise ValueError("batch_size > 1 can't be combined with a cascade judge (cascade_model / JUDGE_CASCADE_MODEL)")
+            if self.timeout is not None or self.hedge_quantile is not None:
+                raise ValueError("batch_size > 1 can't be combined with timeout or hedge_quantile")
+            if self.samples > 1:
+                raise ValueError("batch_size > 1 can't be combined with samples > 1")
+        return self
 
 
-def load_dataset(dataset: str, rater_id: int, num_examples: Optional[int] = None):
+def load_dataset(dataset: str, rater_id: int, num_examples: Optional[int] = None, essay_ids: list[str] | None = None):
     if dataset == "representative":
         file_path = "datasets/aes/representative_samples.csv"
     else:
@@ -29,44 +100,255 @@ def load_dataset(dataset: str, rater_id: int, num_examples: Optional[int] = None
         reader = csv.DictReader(f)
         data = list(reader)
 
+    if essay_ids is not None:
+        by_id = {row['essay_id']: row for row in data}
+        data = [by_id[essay_id] for essay_id in essay_ids]
     if num_examples:
         data = random.sample(data, min(num_examples, len(data)))
 
     return [{"essay_id": row['essay_id'], "essay_text": row['essay'], "score": float(row[f'rater{rater_id}_mapped_score'])} for row in data]
 
 
-def run_essay_eval(eval_config: EssayEvalConfig):
-    metric = ComparisonGEval(
+def build_metric(eval_config: EssayEvalConfig):
+    return ComparisonGEval(
         verbose_mode=False,
         name=f"Run Eval with Rubric (Rater {eval_config.rater_id})",
         evaluation_steps=eval_config.rubric,
         evaluation_params=[LLMTestCaseParams.INPUT,],
+        score_mode=eval_config.score_mode,
+        include_reason=eval_config.include_reason,
+        timeout=eval_config.timeout,
+        hedge_quantile=eval_config.hedge_quantile,
+        samples=eval_config.samples,
+        escalation_threshold=eval_config.escalation_threshold,
+        stream=eval_config.stream,
+        stream_reasons=eval_config.stream_reasons,
         **config.get_model_param(),
-        **config.get_async_param()
+        **config.get_cascade_param(eval_config.cascade_model),
+        **config.get_async_param(),
+        **config.get_cache_param()
+    )
+
+
+def build_test_case(item):
+    return LLMTestCase(
+        input=item['essay_text'],
+        actual_output=""  # We don't have a generated essay in this case
     )
 
+
+async def score_essays(metric: ComparisonGEval, dataset, controller: AdaptiveConcurrency, batch_size: int = 1, on_result=None):
+    """Results in dataset order. ``on_result(item, result)`` sees each result as it
+    arrives; once it returns True the essays not scored yet are cancelled and left as None."""
+    async def score_batch(batch):
+        if batch_size > 1:
+            test_cases = [build_test_case(item) for item in batch]
+            results = await a_safe_measure_batch(metric, test_cases, controller=controller, rescore_missing=False)
+            # Essays the batch answer dropped are re-scored singly, each in its own concurrency slot
+            missing = [i for i, result in enumerate(results) if result is None]
+            rescored = await asyncio.gather(*(
+                a_safe_measure_result(metric, test_cases[i], controller=controller) for i in missing))
+            for i, result in zip(missing, rescored):
+                results[i] = result
+            return results
+        return [await a_safe_measure_result(metric, build_test_case(batch[0]), controller=controller)]
+
+    tasks = [asyncio.ensure_future(score_batch(dataset[i:i + batch_size])) for i in range(0, len(dataset), batch_size)]
+    offsets = {task: n * batch_size for n, task in enumerate(tasks)}
+    scores = [None] * len(dataset)
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            stop = False
+            for task in done:
+                for i, result in enumerate(task.result(), offsets[task]):
+                    scores[i] = result
+                    stop = (on_result is not None and on_result(dataset[i], result)) or stop
+            if stop:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return scores
+
+
+def pre_score_essays(metric: ComparisonGEval, pre_scorer: PreScorer, rubric_id: str, dataset) -> list[ComparisonGEvalResult | None]:
+    if not dataset:
+        return []
+    start = time.perf_counter()
+    predictions = pre_scorer.predict(rubric_id, [item['essay_text'] for item in dataset])
+    if predictions is None:
+        return [None] * len(dataset)
+    latency = (time.perf_counter() - start) / len(dataset)
+    return [
+        metric.build_result(JudgeVerdict(max(probs, key=probs.get), None, probs, None), 0, latency)
+        for probs in predictions
+    ]
+
+
+def pre_scorer_report(dataset, local_results, scores, audited):
+    """Local vs judge agreement on the audited essays, which the local model was confident about."""
+    if not audited:
+        return {"audited": 0}
+    human = [dataset[i]['score'] for i in audited]
+    local = [local_results[i].score for i in audited]
+    judge = [scores[i].score for i in audited]
+    kappa_local = compute_weighted_kappa(human, local)
+    kappa_judge = compute_weighted_kappa(human, judge)
+    return {
+        "audited": len(audited),
+        "agreement": sum(a == b for a, b in zip(local, judge)) / len(audited),
+        "kappa_local_vs_judge": compute_weighted_kappa(judge, local),
+        "kappa_human_vs_local": kappa_local,
+        "kappa_human_vs_judge": kappa_judge,
+        "kappa_delta": kappa_local - kappa_judge,
+    }
+
+
+def needs_reason(eval_config: EssayEvalConfig, item, result):
+    if abs(item['score'] - result.score) >= eval_config.reason_delta_threshold:
+        return True
+    return result.confidence is not None and result.confidence < eval_config.reason_confidence_threshold
+
+
+async def explain_flagged_essays(metric: ComparisonGEval, eval_config: EssayEvalConfig, dataset, scores, controller: AdaptiveConcurrency, skip=()):
+    async def explain_essay(i, item, result):
+        # Essays the pre-scorer handled stay off the judge entirely
+        if i in skip or result.reason is not None:
+            return result.reason
+        if not needs_reason(eval_config, item, result):
+            # Its reason may still be streaming in; nobody is going to read it
+            await metric.a_close_streams([build_test_case(item)])
+            return result.reason
+        return await controller.call(metric.a_explain, build_test_case(item), result.choice)
+
+    return await asyncio.gather(*(explain_essay(i, item, result) for i, (item, result) in enumerate(zip(dataset, scores))))
+
+
+def compute_weighted_kappa(human_scores, ai_scores):
+    # Calculate weighted kappa with scaled scores, rounding so that
+    # logprob-weighted scores land in the nearest bucket
+    return cohen_kappa_score(
+        np.rint(np.array(human_scores) * 10).astype(int),
+        np.rint(np.array(ai_scores) * 10).astype(int),
+        weights='quadratic'
+    )
+
+
+def build_controller(eval_config: EssayEvalConfig):
+    concurrency = eval_config.concurrency or config.CONCURRENCY
+    # Starts at the configured concurrency and adapts to the provider's 429s
+    return AdaptiveConcurrency(
+        initial=concurrency,
+        max_limit=max(concurrency, eval_config.max_concurrency or config.MAX_CONCURRENCY),
+    )
+
+
+async def a_run_essay_eval(eval_config: EssayEvalConfig, controller: AdaptiveConcurrency | None = None):
+    """Pass a ``controller`` to share one judge concurrency limit between concurrent runs."""
     dataset = load_dataset(eval_config.dataset,
-                           eval_config.rater_id, eval_config.num_examples)
+                           eval_config.rater_id, eval_config.num_examples, eval_config.essay_ids)
+    controller = controller or build_controller(eval_config)
+
+    metric = build_metric(eval_config)
+    store = get_score_store() if eval_config.score_store else None
+    store_key = (ScoreStore.rubric_hash(eval_config.rubric), metric.evaluation_model,
+                 ScoreStore.judge_mode(metric, batched=eval_config.batch_size > 1), ComparisonGEvalTemplate.VERSION)
+    stored = [None] * len(dataset)
+    if store is not None:
+        stored = store.get_many(*store_key, [item['essay_id'] for item in dataset])
+    reused = {i for i, verdict in enumerate(stored) if verdict is not None}
+
+    pre_scorer = get_pre_scorer() if eval_config.pre_scorer else None
+    rubric_id = PreScorer.rubric_id(eval_config.rubric)
+    local_results = [None] * len(dataset)
+    if pre_scorer is not None:
+        local_results = pre_score_essays(metric, pre_scorer, rubric_id, dataset)
+    confident = [
+        i for i, result in enumerate(local_results)
+        if i not in reused and result is not None and result.confidence >= eval_config.pre_scorer_threshold
+    ]
+    audited = [i for i in confident if random.random() < eval_config.pre_scorer_audit]
+    skipped = set(confident) - set(audited)
+    judged_indices = [i for i in range(len(dataset)) if i not in skipped and i not in reused]
+
+    scores = list(local_results)
+    for i in reused:
+        scores[i] = metric.build_result(stored[i], 0, 0)
+
+    # Essays that cost no judge call count towards the kappa estimate up front
+    accumulator = KappaAccumulator()
+    for i in skipped | reused:
+        accumulator.add(dataset[i]['score'], scores[i].score)
+    sequential = eval_config.kappa_ci_width is not None or eval_config.kappa_threshold is not None
+    stopped_by = None
+    if sequential:
+        # A run cut short should still be a random sample of the dataset
+        random.shuffle(judged_indices)
+
+    # Every check the run could make, for the threshold test's repeated-looks correction
+    looks = max(1, len(dataset) // KAPPA_CHECK_EVERY - (eval_config.kappa_min_essays - 1) // KAPPA_CHECK_EVERY)
+
+    def record(item, result):
+        nonlocal stopped_by
+        accumulator.add(item['score'], result.score)
+        if not sequential or stopped_by is not None or accumulator.n % KAPPA_CHECK_EVERY:
+            return False
+        stopped_by = accumulator.decision(
+            eval_config.kappa_ci_width, eval_config.kappa_threshold,
+            eval_config.kappa_confidence, eval_config.kappa_min_essays, looks)
+        return stopped_by is not None
+
+    judged = await score_essays(metric, [dataset[i] for i in judged_indices], controller, eval_config.batch_size, on_result=record)
+    unjudged = {i for i, result in zip(judged_indices, judged) if result is None}
+    if unjudged:
+        # Stopped early: the run continues over the essays scored so far
+        keep = [i for i in range(len(dataset)) if i not in unjudged]
+        position = {i: n for n, i in enumerate(keep)}
+        judged = [result for result in judged if result is not None]
+        judged_indices = [position[i] for i in judged_indices if i in position]
+        skipped = {position[i] for i in skipped}
+        reused = {position[i] for i in reused}
+        # Audited essays are judged too, so the stop can cut them like any other
+        audited = [position[i] for i in audited if i in position]
+        dataset, scores, local_results = ([values[i] for i in keep] for values in (dataset, scores, local_results))
+    for i, result in zip(judged_indices, judged):
+        scores[i] = result
+
+    if pre_scorer is not None:
+        pre_scorer.add(rubric_id, [(dataset[i]['essay_text'], result.choice) for i, result in zip(judged_indices, judged)])
+        pre_scorer.maybe_retrain()
+    reasons = await explain_flagged_essays(metric, eval_config, dataset, scores, controller, skip=skipped | reused)
+    # e.g. streams of essays a sequential kappa stop cancelled after their choice arrived
+    await metric.a_close_streams()
+    if store is not None:
+        store.put_many(*store_key, {
+            dataset[i]['essay_id']: JudgeVerdict(scores[i].choice, reasons[i], scores[i].choice_probs, None)
+            for i in judged_indices
+        })
 
     results = []
     human_scores = []
     ai_scores = []
-    for item in dataset:
-        test_case = LLMTestCase(
-            input=item['essay_text'],
-            actual_output=""  # We don't have a generated essay in this case
-        )
-        safe_measure(metric, test_case)
+    for i, (item, result, ai_reason) in enumerate(zip(dataset, scores, reasons)):
+        ai_score = result.score
         results.append({
             'essay_id': item['essay_id'],
             'essay_text': item['essay_text'],
             'human_score': item['score'],
-            'ai_score': metric.score,
-            'ai_reason': metric.reason,
-            'delta': item['score'] - metric.score,
+            'ai_score': ai_score,
+            'ai_reason': ai_reason,
+            'ai_confidence': result.confidence,
+            # Raw judge output, kept so scores can be re-mapped offline
+            'ai_choice': result.choice,
+            'ai_choice_probs': result.choice_probs,
+            'ai_source': 'local' if i in skipped else 'store' if i in reused else 'judge',
+            'delta': item['score'] - ai_score,
         })
         human_scores.append(item['score'])
-        ai_scores.append(metric.score)
+        ai_scores.append(ai_score)
 
         print(f"\n--- Essay ID: {item['essay_id']} ---")
         print(f"Essay Text:\n{item['essay_text']}\n")
@@ -75,21 +357,51 @@ def run_essay_eval(eval_config: EssayEvalConfig):
             print(f"{i}. {criterion}")
         print("\nResults:")
         print(f"Human Score: {item['score']}")
-        print(f"AI Score: {metric.score}")
-        print(f"AI Reason: {metric.reason}")
-        print(f"Delta: {item['score'] - metric.score}")
+        print(f"AI Score: {ai_score}")
+        print(f"AI Reason: {ai_reason}")
+        print(f"Delta: {item['score'] - ai_score}")
         print("-" * 50)
 
-    # Calculate weighted kappa with scaled scores
-    weighted_kappa = cohen_kappa_score(
-        (np.array(human_scores) * 10).astype(int),
-        (np.array(ai_scores) * 10).astype(int),
-        weights='quadratic'
-    )
+    weighted_kappa = compute_weighted_kappa(human_scores, ai_scores)
+    print(f"Kappa: {accumulator.summary(eval_config.kappa_confidence)}")
+    if unjudged:
+        print(f"Stopped early ({stopped_by}): {len(judged_indices)} essays judged, {len(unjudged)} skipped")
+
+    # Only essays that went to the judge; stored and pre-scored ones took next to no time
+    latencies = LatencyTracker(window=max(len(judged), 1))
+    for result in judged:
+        latencies.record(result.latency)
+    print(f"Judge latency: {latencies.summary()}")
+    if eval_config.samples > 1 and scores:
+        drawn = [result.samples or 0 for result in scores]
+        print(f"Judge samples: {sum(drawn)} for {len(drawn)} essays ({sum(drawn) / len(drawn):.1f} avg, max {eval_config.samples})")
+    if pre_scorer is not None:
+        print(f"Pre-scorer: {len(skipped)} essays scored locally, {len(judged_indices)} judged "
+              f"(trained on {pre_scorer.trained_on}); {pre_scorer_report(dataset, local_results, scores, audited)}")
+    if metric.cascade_metric is not None:
+        print(f"Judge cascade: {metric.cascade_stats.summary()}")
+    if store is not None:
+        print(f"Score store: {len(reused)} of {len(dataset)} essays reused, {len(judged_indices)} judged")
+    print(f"Judge parsing: {metric.parse_stats.summary()}")
+    print(f"Judge concurrency: {controller.stats()}")
+    judge_cache = metric.cache or getattr(metric.model, "cache", None)
+    if judge_cache is not None:
+        print(f"Judge cache: {judge_cache.hits} hits, {judge_cache.misses} misses")
 
     return results, weighted_kappa
 
 
+def run_essay_eval(eval_config: EssayEvalConfig):
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(a_run_essay_eval(eval_config))
+    # Called from inside an event loop (e.g. a notebook): asyncio.run can't nest, so
+    # the eval gets its own loop on a worker thread
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, a_run_essay_eval(eval_config)).result()
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run essay evaluation")
     parser.add_argument('eval_config', type=str,
@@ -1,28 +1,45 @@
+import asyncio
 import time
 import random
 from functools import wraps
 import openai
 
+from src.utils.adaptive_concurrency import MaxRetriesExceeded, retry_after
+
+
+def backoff_delay(error, retries, base_delay):
+    # Trust the provider's Retry-After/rate-limit headers over a blind guess
+    delay = retry_after(error)
+    if delay is None:
+        delay = (2 ** retries) * base_delay + random.uniform(0, 1)
+    return delay
 
-def exponential_backoff(max_retries=5, base_delay=2, reset_after=60):
-    def decorator(func):
-        last_attempt = 0
-        retries = 0
 
+def exponential_backoff(max_retries=5, base_delay=2):
+    def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            nonlocal last_attempt, retries
-            while retries < max_retries:
+            for retries in range(max_retries):
                 try:
-                    if time.time() - last_attempt > reset_after:
-                        retries = 0
                     return func(*args, **kwargs)
-                except openai.RateLimitError:
-                    wait = (2 ** retries) * base_delay + random.uniform(0, 1)
-                    time.sleep(wait)
-                    retries += 1
-                    last_attempt = time.time()
-            raise Exception("Max retries exceeded")
+                except openai.RateLimitError as e:
+                    time.sleep(backoff_delay(e, retries, base_delay))
+            raise MaxRetriesExceeded(f"Gave up after {max_retries} rate-limited attempts")
+        return wrapper
+    return decorator
+
+
+def async_exponential_backoff(max_retries=5, base_delay=2):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            # Retry state is per call: concurrent callers must not share a counter
+            for retries in range(max_retries):
+                try:
+                    return await func(*args, **kwargs)
+                except openai.RateLimitError as e:
+                    await asyncio.sleep(backoff_delay(e, retries, base_delay))
+            raise MaxRetriesExceeded(f"Gave up after {max_retries} rate-limited attempts")
         return wrapper
     return decorator
 
@@ -33,3 +50,36 @@ def safe_measure(metric, *args, **kwargs):
         return metric.measure(*args, **kwargs)
 
     return wrapped_measure()
+
+
+async def a_safe_measure(metric, *args, controller=None, **kwargs):
+    if controller is not None:
+        return await controller.call(metric.a_measure, *args, **kwargs)
+
+    @async_exponential_backoff()
+    async def wrapped_measure():
+        return await metric.a_measure(*args, **kwargs)
+
+    return await wrapped_measure()
+
+
+async def a_safe_measure_result(metric, *args, controller=None, **kwargs):
+    if controller is not None:
+        return await controller.call(metric.a_measure_result, *args, **kwargs)
+
+    @async_exponential_backoff()
+    async def wrapped_measure_result():
+        return await metric.a_measure_result(*args, **kwargs)
+
+    return await wrapped_measure_result()
+
+
+async def a_safe_measure_batch(metric, test_cases, controller=None, **kwargs):
+    if controller is not None:
+        return await controller.call(metric.a_measure_batch, test_cases, **kwargs)
+
+    @async_exponential_backoff()
+    async def wrapped_measure_batch():
+        return await metric.a_measure_batch(test_cases, **kwargs)
+
+    return await wrapped_measure_batch()
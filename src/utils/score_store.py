@@ -0,0 +1,118 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from src.config import config
+from src.metrics.comparison_g_eval.comparison_g_eval_metric import (
+    ComparisonGEval,
+    JudgeVerdict,
+)
+
+
+class ScoreStore:
+    """Judge verdicts per (rubric, essay), shared by every eval and optimization run.
+
+    Entries are keyed by a normalized rubric hash, the essay id, the judge
+    model, the judging mode (see ``judge_mode``) and the judge template
+    version, and hold the raw verdict (choice, reason, choice distribution),
+    so the score is re-derived under the current score mode when read back.
+    A rubric the optimizer comes back to, or one an earlier run already
+    scored the same way, is not sent to the judge again.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                rubric_hash TEXT NOT NULL,
+                essay_id TEXT NOT NULL,
+                judge_model TEXT NOT NULL,
+                judge_mode TEXT NOT NULL,
+                template_version TEXT NOT NULL,
+                verdict TEXT NOT NULL,
+                PRIMARY KEY (rubric_hash, essay_id, judge_model, judge_mode, template_version)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def rubric_hash(rubric: list[str]) -> str:
+        # Case, spacing and blank steps don't change what the judge is asked
+        steps = [re.sub(r"\s+", " ", step).strip().casefold() for step in rubric]
+        return hashlib.sha256(json.dumps([step for step in steps if step]).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def judge_mode(metric: ComparisonGEval, batched: bool = False) -> str:
+        """The metric settings that change which verdict the judge gives, beyond the rubric and model.
+
+        Prompt variant (reasons, batches), sampling, streaming (no choice
+        distribution) and the cascade (whose verdicts may come from the cheaper
+        model) all do; a verdict is only reused by a run judging the same way.
+        """
+        cascade = metric.cascade_metric
+        return json.dumps({
+            "include_reason": metric.include_reason,
+            "score_mode": metric.score_mode,
+            "samples": metric.samples,
+            "stream": metric.stream,
+            "batched": batched,
+            "cascade_model": cascade.evaluation_model if cascade is not None else None,
+            "escalation_threshold": metric.escalation_threshold if cascade is not None else None,
+        }, sort_keys=True)
+
+    def get_many(self, rubric_hash: str, judge_model: str, judge_mode: str, template_version: str,
+                 essay_ids: list[str]) -> list[JudgeVerdict | None]:
+        """The stored verdict for each essay id, or None where it hasn't been judged under this key."""
+        with self._lock:
+            rows = dict(self._conn.execute(
+                f"""SELECT essay_id, verdict FROM verdicts
+                    WHERE rubric_hash = ? AND judge_model = ? AND judge_mode = ? AND template_version = ?
+                    AND essay_id IN ({", ".join("?" * len(essay_ids))})""",
+                (rubric_hash, judge_model, judge_mode, template_version, *essay_ids),
+            ).fetchall())
+        verdicts = []
+        for essay_id in essay_ids:
+            data = json.loads(rows[essay_id]) if essay_id in rows else None
+            verdicts.append(None if data is None else JudgeVerdict(
+                data["choice"], data["reason"], data.get("choice_probs"), 0))
+        found = sum(verdict is not None for verdict in verdicts)
+        self.hits += found
+        self.misses += len(verdicts) - found
+        return verdicts
+
+    def put_many(self, rubric_hash: str, judge_model: str, judge_mode: str, template_version: str,
+                 verdicts: dict[str, JudgeVerdict]):
+        with self._lock:
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO verdicts (rubric_hash, essay_id, judge_model, judge_mode, template_version, verdict)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [
+                    (rubric_hash, essay_id, judge_model, judge_mode, template_version, json.dumps({
+                        "choice": verdict.choice,
+                        "reason": verdict.reason,
+                        "choice_probs": verdict.choice_probs,
+                    }))
+                    for essay_id, verdict in verdicts.items()
+                ],
+            )
+            self._conn.commit()
+
+
+_score_store = None
+
+
+def get_score_store() -> ScoreStore:
+    """Process-wide score store at SCORE_STORE_PATH."""
+    global _score_store
+    if _score_store is None:
+        _score_store = ScoreStore(config.SCORE_STORE_PATH)
+    return _score_store
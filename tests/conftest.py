@@ -0,0 +1,66 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+def completion_body(content: str) -> dict:
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stub-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    }
+
+
+class StubServer:
+    """A local OpenAI-compatible endpoint answering with queued (status, headers) replies, then 200s."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.replies = []
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                server.requests += 1
+                status, headers = server.replies.pop(0) if server.replies else (200, {})
+                body = json.dumps(completion_body(server.name) if status == 200 else {
+                    "error": {"message": f"HTTP {status}", "type": "stub", "code": status}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    """Factory for local stub endpoints, shut down after the test."""
+    servers = []
+
+    def start(name: str = "stub") -> StubServer:
+        servers.append(StubServer(name))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from src.prompts import improve_essay_rubric
+from src.prompts.improve_essay_rubric import (
+    RUBRIC_MARKER,
+    a_stream_rubric,
+    parse_rubric,
+)
+
+EXAMPLE = 'For example:\n```json\n["Is this an example?"]\n```\n'
+DRAFT = 'A first draft:\n```json\n["Draft step"]\n```\nOn reflection that is too narrow.\n'
+FINAL = f'{RUBRIC_MARKER}\n```json\n["Final step", "Another step"]\n```'
+
+
+class StubStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            self.sent += 1
+            yield chunk
+
+
+class StubClient:
+    """Stands in for anthropic.AsyncAnthropic, streaming the given chunks."""
+
+    def __init__(self, chunks):
+        self.messages = self
+        self.response = StubStream(chunks)
+
+    def stream(self, **kwargs):
+        return self.response
+
+
+class NoLimit:
+    async def a_acquire(self, tokens=0):
+        pass
+
+
+def stream_rubric(monkeypatch, chunks):
+    monkeypatch.setattr(improve_essay_rubric, "get_rate_limiter", lambda *args: NoLimit())
+    monkeypatch.setattr(improve_essay_rubric, "estimate_tokens", lambda *args: 0)
+    client = StubClient(chunks)
+    rubric, _ = asyncio.run(a_stream_rubric(client, "prompt", 1000))
+    return rubric, client.response.sent
+
+
+@pytest.mark.parametrize("text", [
+    EXAMPLE + FINAL,
+    DRAFT + FINAL,
+    FINAL.replace(RUBRIC_MARKER, f"**{RUBRIC_MARKER.upper()}**"),
+    f"{RUBRIC_MARKER}\n```json\n[\"broken\"\n```\n```json\n[\"Final step\", \"Another step\"]\n```",
+])
+def test_parse_rubric_takes_the_block_after_the_marker(text):
+    assert parse_rubric(text) == ["Final step", "Another step"]
+
+
+def test_parse_rubric_without_the_marker_takes_the_last_block():
+    assert parse_rubric(EXAMPLE + '```json\n["Repaired step"]\n```\n```json\n{"not": "a rubric"}\n```') == [
+        "Repaired step"]
+    assert parse_rubric(EXAMPLE, require_marker=True) is None
+    assert parse_rubric("no rubric here") is None
+
+
+def test_stream_reads_past_an_example_to_the_real_rubric(monkeypatch):
+    chunks = [EXAMPLE, DRAFT, f"{RUBRIC_MARKER}\n```json\n", '["Final step", "Another step"]\n', "```", "\nTrailing", " text"]
+
+    rubric, sent = stream_rubric(monkeypatch, chunks)
+
+    assert rubric == ["Final step", "Another step"]
+    # Hung up right after the rubric's closing fence
+    assert sent == 5
+
+
+def test_stream_without_the_marker_reads_to_the_end(monkeypatch):
+    chunks = [EXAMPLE, 'Then:\n```json\n["Last step"]\n```', "\nTrailing"]
+
+    rubric, sent = stream_rubric(monkeypatch, chunks)
+
+    assert rubric == ["Last step"]
+    assert sent == len(chunks)
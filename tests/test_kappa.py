@@ -0,0 +1,67 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from src.utils.kappa import KappaAccumulator
+from src.utils.rescore import weighted_kappa
+from src.utils.run_essay_eval import compute_weighted_kappa
+
+CASES = 300
+
+
+def random_case(rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """Human and AI scores in [0, 1], like the essay grader's, over a random subset of buckets."""
+    n = int(rng.integers(2, 80))
+    levels = rng.choice(np.linspace(0, 1, 11), size=int(rng.integers(1, 12)), replace=False)
+    human = rng.choice(levels, size=n)
+    # Mostly agreeing, sometimes off by a few buckets, sometimes between buckets (logprob scores)
+    ai = np.clip(human + rng.choice([0, 0, 0.1, -0.1, 0.3], size=n), 0, 1)
+    ai = np.where(rng.random(n) < 0.2, rng.random(n), ai)
+    return human, ai
+
+
+def sklearn_kappa(human, ai) -> float:
+    # One shared bucket leaves sklearn dividing 0 by 0; ours return NaN for it too
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return float(compute_weighted_kappa(human, ai))
+
+
+@pytest.mark.parametrize("seed", range(CASES))
+def test_matches_sklearn(seed):
+    human, ai = random_case(np.random.default_rng(seed))
+    expected = sklearn_kappa(human, ai)
+
+    accumulator = KappaAccumulator()
+    accumulator.add_many(human, ai)
+
+    np.testing.assert_allclose(weighted_kappa(human, ai), expected, rtol=1e-9, atol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(accumulator.kappa(), expected, rtol=1e-9, atol=1e-12, equal_nan=True)
+
+
+def test_accumulator_matches_whatever_the_order():
+    human, ai = random_case(np.random.default_rng(1234))
+    accumulator = KappaAccumulator()
+    for i in np.random.default_rng(0).permutation(len(human)):
+        accumulator.add(human[i], ai[i])
+
+    np.testing.assert_allclose(accumulator.kappa(), sklearn_kappa(human, ai), rtol=1e-9, equal_nan=True)
+
+
+def test_threshold_test_is_corrected_for_repeated_looks():
+    human, ai = random_case(np.random.default_rng(7))
+
+    def accumulator():
+        # Same seed, so every accumulator draws the same bootstrap resamples
+        accumulator = KappaAccumulator()
+        accumulator.add_many(human, ai)
+        return accumulator
+
+    nominal, _ = accumulator().interval(0.95)
+    corrected, _ = accumulator().interval(1 - 0.05 / 20)
+    assert corrected < nominal
+    threshold = (nominal + corrected) / 2
+
+    assert accumulator().decision(threshold=threshold, min_essays=0) == "above"
+    assert accumulator().decision(threshold=threshold, min_essays=0, looks=20) is None
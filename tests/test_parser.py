@@ -0,0 +1,51 @@
+import pytest
+
+from src.metrics.comparison_g_eval.parser import load_json, parse_reason_score
+
+
+@pytest.mark.parametrize(("text", "repaired"), [
+    ('{"choice": "B", "reason": "ok"}', False),
+    ('Here you go:\n```json\n{"choice": "B", "reason": "ok"}\n```\nHope that helps.', False),
+    ('```\n{"choice": "B", "reason": "ok"}\n```', False),
+    ('{"choice": "B", "reason": "ok",}', True),
+    ("{'choice': 'B', 'reason': 'ok'}", True),
+    ('{"choice": "B", "reason": "ok"', True),
+])
+def test_load_json_repairs_common_slips(text, repaired):
+    assert load_json(text) == ({"choice": "B", "reason": "ok"}, repaired)
+
+
+@pytest.mark.parametrize("text", ["no object here", '{"choice": B, reason}'])
+def test_load_json_rejects_what_it_cannot_repair(text):
+    with pytest.raises(ValueError):
+        load_json(text)
+
+
+@pytest.mark.parametrize(("text", "expected"), [
+    ('{"choice": "C", "reason": "Clear thesis."}', ("C", "Clear thesis.", False)),
+    ('```json\n{"choice": " C ", "reason": "Clear thesis.",}\n```', ("C", "Clear thesis.", True)),
+    ("{'choice': 'C', 'reason': 'Clear thesis.'}", ("C", "Clear thesis.", True)),
+    ('{"choice": "C", "reason": "Clear thesis."', ("C", "Clear thesis.", True)),
+    ('{"choice": "C"}', ("C", None, True)),
+    # Unparseable JSON falls back to the fields' regexes
+    ('{"choice": "C", "reason": "Says "quoted" things."}', ("C", 'Says "quoted" things.', True)),
+    ("Choice: B\nReason: 'Mostly there.'", ("B", "Mostly there.", True)),
+    ("After weighing it up, CHOICE = E", ("E", None, True)),
+])
+def test_parse_reason_score(text, expected):
+    assert parse_reason_score(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    '{"choice": true, "reason": "ok"}',
+    '{"choice": null, "reason": "ok"}',
+    '{"choice": "I", "reason": "ok"}',
+    '{"choice": "AB", "reason": "ok"}',
+    # Choices are uppercase on both the JSON and the regex path
+    '{"choice": "b", "reason": "ok"}',
+    "choice: a good essay overall",
+    '{"reason": "no choice given"}',
+])
+def test_parse_reason_score_rejects_invalid_choices(text):
+    with pytest.raises(ValueError):
+        parse_reason_score(text)
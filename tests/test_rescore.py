@@ -0,0 +1,20 @@
+import pytest
+
+from src.metrics.comparison_g_eval.template import ComparisonGEvalTemplate
+from src.utils.rescore import rescore
+
+
+def test_rescoring_leaves_the_live_table_alone():
+    before = dict(ComparisonGEvalTemplate.CHOICE_SCORES)
+    results = [{"ai_choice": "A", "ai_score": 0.6}, {"ai_choice": "E", "ai_score": 1.0}]
+
+    scores, known = rescore(results, {"A": 0.5, "E": 0.9})
+
+    assert scores.tolist() == [0.5, 0.9] and known.all()
+    assert ComparisonGEvalTemplate.CHOICE_SCORES == before
+    assert ComparisonGEvalTemplate.calculate_score("A") == 0.6
+
+
+def test_choice_scores_are_read_only():
+    with pytest.raises(TypeError):
+        ComparisonGEvalTemplate.CHOICE_SCORES["A"] = 0.5
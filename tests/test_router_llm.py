@@ -0,0 +1,171 @@
+import asyncio
+import socket
+import time
+
+import httpx
+import openai
+import pytest
+from openai.types.chat import ChatCompletion
+
+from src.deepeval.router_llm import RouterLLM
+
+
+def completion(content: str) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "stub-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+    })
+
+
+def api_error(status: int) -> openai.APIStatusError:
+    response = httpx.Response(status, request=httpx.Request("POST", "https://stub/v1/chat/completions"))
+    error = openai.RateLimitError if status == 429 else openai.InternalServerError
+    return error(f"HTTP {status}", response=response, body=None)
+
+
+class StubLLM:
+    """Stands in for an endpoint's client: raises the queued errors, then answers."""
+
+    def __init__(self, name: str, errors=()):
+        self.name = name
+        self.errors = list(errors)
+        self.calls = 0
+
+    def generate_raw_response(self, prompt: str, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return completion(self.name), None
+
+    async def a_generate_raw_response(self, prompt: str, **kwargs):
+        return self.generate_raw_response(prompt, **kwargs)
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, tokens: int = 0):
+        self.acquired += 1
+
+    async def a_acquire(self, tokens: int = 0):
+        self.acquired += 1
+
+
+def make_router(primary_errors=(), secondary_errors=()) -> RouterLLM:
+    # The primary's weight makes it the first pick, so the secondary only sees failovers
+    router = RouterLLM([
+        {"name": "primary", "base_url": "https://primary/v1", "model": "stub-model", "weight": 1e9},
+        {"name": "secondary", "base_url": "https://secondary/v1", "model": "stub-model", "weight": 1e-9},
+    ])
+    router.endpoints[0].llm = StubLLM("primary", primary_errors)
+    router.endpoints[1].llm = StubLLM("secondary", secondary_errors)
+    router.rate_limiter = CountingLimiter()
+    return router
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_fails_over_to_the_next_endpoint(status):
+    router = make_router(primary_errors=[api_error(status)])
+
+    response, _ = router.generate_raw_response("prompt")
+
+    assert response.choices[0].message.content == "secondary"
+    stats = router.stats()
+    assert stats["primary"] == {"requests": 1, "errors": 1, "in_flight": 0, "healthy": False}
+    assert stats["secondary"] == {"requests": 1, "errors": 0, "in_flight": 0, "healthy": True}
+
+
+@pytest.mark.parametrize("status", [429, 500])
+def test_async_fails_over_to_the_next_endpoint(status):
+    router = make_router(primary_errors=[api_error(status)])
+
+    response, _ = asyncio.run(router.a_generate_raw_response("prompt"))
+
+    assert response.choices[0].message.content == "secondary"
+    assert router.stats()["primary"]["healthy"] is False
+
+
+def test_endpoint_out_of_rotation_is_skipped():
+    router = make_router(primary_errors=[api_error(429)])
+    router.generate_raw_response("first")
+
+    response, _ = router.generate_raw_response("second")
+
+    assert response.choices[0].message.content == "secondary"
+    assert router.endpoints[0].llm.calls == 1
+
+
+def test_raises_the_last_error_when_every_endpoint_fails():
+    router = make_router(primary_errors=[api_error(500)], secondary_errors=[api_error(429)])
+
+    with pytest.raises(openai.RateLimitError):
+        router.generate_raw_response("prompt")
+
+
+def test_router_budget_is_taken_once_per_call():
+    router = make_router(primary_errors=[api_error(429)])
+
+    router.generate_raw_response("prompt")
+    asyncio.run(router.a_generate_raw_response("prompt"))
+
+    assert router.rate_limiter.acquired == 2
+
+
+def refused_url() -> str:
+    """A local URL nothing listens on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/v1"
+
+
+def make_http_router(primary_url: str, secondary_url: str) -> RouterLLM:
+    return RouterLLM([
+        {"name": "primary", "base_url": primary_url, "model": "stub-model", "weight": 1e9},
+        {"name": "secondary", "base_url": secondary_url, "model": "stub-model", "weight": 1e-9},
+    ])
+
+
+def cooldown(endpoint) -> float:
+    return endpoint.down_until - time.monotonic()
+
+
+@pytest.mark.parametrize(("headers", "expected"), [
+    ({"Retry-After": "30"}, 30),
+    ({"retry-after-ms": "45000"}, 45),
+    ({"x-ratelimit-reset-requests": "1m30s"}, 90),
+])
+def test_http_429_fails_over_for_as_long_as_the_headers_ask(stub_server, headers, expected):
+    primary, secondary = stub_server("primary"), stub_server("secondary")
+    primary.replies = [(429, headers)]
+    router = make_http_router(primary.base_url, secondary.base_url)
+
+    assert router.generate("prompt") == "secondary"
+    assert (primary.requests, secondary.requests) == (1, 1)
+    assert expected - 5 < cooldown(router.endpoints[0]) <= expected
+
+
+def test_http_500_fails_over_with_a_short_cooldown(stub_server):
+    primary, secondary = stub_server("primary"), stub_server("secondary")
+    primary.replies = [(500, {})]
+    router = make_http_router(primary.base_url, secondary.base_url)
+
+    assert asyncio.run(router.a_generate("prompt")) == "secondary"
+    # Failover is the retry, so the failing endpoint is only asked once
+    assert (primary.requests, secondary.requests) == (1, 1)
+    assert 0 < cooldown(router.endpoints[0]) <= 1
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_refused_connection_fails_over(stub_server, use_async):
+    secondary = stub_server("secondary")
+    router = make_http_router(refused_url(), secondary.base_url)
+
+    answer = asyncio.run(router.a_generate("prompt")) if use_async else router.generate("prompt")
+
+    assert answer == "secondary"
+    assert router.stats()["primary"] == {"requests": 1, "errors": 1, "in_flight": 0, "healthy": False}
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+import json
+import random
+
+from deepeval.models.base_model import DeepEvalBaseLLM
+
+from src.config import config
+from src.utils import run_essay_eval
+from src.utils.run_essay_eval import EssayEvalConfig, a_run_essay_eval, load_dataset
+
+LOCAL_CHOICE = "C"
+
+
+def judge_choice(text: str) -> str:
+    return "ABDEFGH"[int(hashlib.md5(text.strip().encode()).hexdigest(), 16) % 7]
+
+
+class StubJudge(DeepEvalBaseLLM):
+    """Answers each essay with a fixed pseudo-random choice, never the pre-scorer's."""
+
+    def __init__(self):
+        super().__init__("stub-judge")
+
+    def load_model(self):
+        return None
+
+    def _answer(self, prompt: str) -> str:
+        choice = judge_choice(prompt.split("Text to evaluate:")[1].split("**")[0].split("Input:")[1])
+        return json.dumps({"choice": choice, "reason": "stub"})
+
+    def generate(self, prompt: str) -> str:
+        return self._answer(prompt)
+
+    async def a_generate(self, prompt: str) -> str:
+        await asyncio.sleep(0.001)
+        return self._answer(prompt)
+
+    def get_model_name(self) -> str:
+        return "stub-judge"
+
+
+class StubPreScorer:
+    """Confident about every other essay, and always picks LOCAL_CHOICE."""
+
+    trained_on = 0
+
+    def __init__(self):
+        self.confident = set()
+
+    def predict(self, rubric_id, texts):
+        predictions = []
+        for i, text in enumerate(texts):
+            if i % 2 == 0:
+                self.confident.add(text)
+                predictions.append({LOCAL_CHOICE: 1.0})
+            else:
+                predictions.append({LOCAL_CHOICE: 0.4, "A": 0.6})
+        return predictions
+
+    def add(self, rubric_id, verdicts):
+        pass
+
+    def maybe_retrain(self):
+        pass
+
+
+def stub_models(monkeypatch) -> StubPreScorer:
+    pre_scorer = StubPreScorer()
+    monkeypatch.setattr(config, "get_model_param", lambda: {"model": StubJudge()})
+    monkeypatch.setattr(run_essay_eval, "get_pre_scorer", lambda: pre_scorer)
+    random.seed(0)
+    return pre_scorer
+
+
+def test_early_stop_drops_unjudged_essays_including_audited(monkeypatch):
+    pre_scorer = stub_models(monkeypatch)
+    eval_config = EssayEvalConfig(
+        rubric=["Is this a well-written essay?"],
+        rater_id=1,
+        dataset="representative",
+        include_reason=True,
+        pre_scorer=True,
+        pre_scorer_audit=0.5,
+        # No rubric gets here, so the run stops as soon as the interval is below it
+        kappa_threshold=0.99,
+        kappa_min_essays=20,
+        concurrency=1,
+    )
+
+    results, _ = asyncio.run(a_run_essay_eval(eval_config))
+
+    dataset = load_dataset("representative", 1)
+    texts = {item["essay_id"]: item["essay_text"] for item in dataset}
+    kept = {result["essay_id"] for result in results}
+    assert len(results) < len(dataset)
+    assert any(result["ai_source"] == "local" for result in results)
+    # Some essays the pre-scorer was sure of were sent to the judge as audits and then cut
+    assert any(texts[essay_id] in pre_scorer.confident for essay_id in set(texts) - kept)
+    for result in results:
+        text = texts[result["essay_id"]]
+        if result["ai_source"] == "local":
+            assert text in pre_scorer.confident
+            assert result["ai_choice"] == LOCAL_CHOICE
+        else:
+            assert result["ai_source"] == "judge"
+            assert result["ai_choice"] == judge_choice(text)
+        human = next(item["score"] for item in dataset if item["essay_id"] == result["essay_id"])
+        assert result["human_score"] == human
+
+
+def test_judge_latency_only_covers_judged_essays(monkeypatch, capsys):
+    stub_models(monkeypatch)
+    eval_config = EssayEvalConfig(
+        rubric=["Is this a well-written essay?"],
+        rater_id=1,
+        dataset="representative",
+        pre_scorer=True,
+        pre_scorer_audit=0,
+        concurrency=1,
+    )
+
+    results, _ = asyncio.run(a_run_essay_eval(eval_config))
+
+    judged = sum(result["ai_source"] == "judge" for result in results)
+    assert 0 < judged < len(results)
+    assert f"Judge latency: {{'count': {judged}," in capsys.readouterr().out
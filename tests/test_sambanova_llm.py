@@ -0,0 +1,41 @@
+import asyncio
+
+import openai
+import pytest
+
+from src.deepeval.sambanova_llm import SambanovaOpenAI
+from src.utils.adaptive_concurrency import AdaptiveConcurrency
+
+# Short enough for the SDK's and the controller's backoff to keep the tests quick
+RETRY_AFTER = {"retry-after-ms": "10"}
+
+
+def test_async_client_retries_server_errors(stub_server):
+    server = stub_server("answer")
+    server.replies = [(502, RETRY_AFTER), (500, RETRY_AFTER)]
+    llm = SambanovaOpenAI(model_name="stub-model", base_url=server.base_url, api_key="test")
+
+    assert asyncio.run(llm.a_generate("prompt")) == "answer"
+    assert server.requests == 3
+
+
+def test_async_client_hands_429s_to_the_caller(stub_server):
+    server = stub_server()
+    server.replies = [(429, RETRY_AFTER)]
+    llm = SambanovaOpenAI(model_name="stub-model", base_url=server.base_url, api_key="test")
+
+    with pytest.raises(openai.RateLimitError):
+        asyncio.run(llm.a_generate("prompt"))
+    assert server.requests == 1
+
+
+def test_controller_retries_server_errors(stub_server):
+    server = stub_server("answer")
+    server.replies = [(503, RETRY_AFTER), (429, RETRY_AFTER)]
+    # No client retries, so every failure reaches the controller
+    llm = SambanovaOpenAI(model_name="stub-model", base_url=server.base_url, api_key="test", max_retries=0)
+    controller = AdaptiveConcurrency(initial=4)
+
+    assert asyncio.run(controller.call(llm.a_generate, "prompt")) == "answer"
+    stats = controller.stats()
+    assert (stats["server_errors"], stats["throttle_events"], stats["successes"]) == (1, 1, 1)